@@ -0,0 +1,294 @@
+"""HTTP job API for quiz generation, for services that cannot drive the Streamlit UI.
+
+    python api_server.py --port 8000
+
+    POST /jobs?num_questions=10&difficulty=Medium&topic=...   body: the raw PDF
+        202 {"job_id": ..., "status": "queued"}; 503 with Retry-After when the queue is full
+    GET /jobs/<job_id>
+        status (queued, running, done, failed), per-job timings and, once done,
+        the question dicts generate_mcq produces
+    GET /stats
+        queue depth, job counts and the shared request scheduler's state
+
+Jobs wait on a bounded queue served by a fixed set of worker threads. They
+share the app's PDF text cache, question bank and request scheduler, so the
+OPENAI_* limits apply to the whole server. Point OPENAI_BASE_URL at a local
+mock server to load test it without the real API.
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+from app import logger, AimockMCQGenerator, DIFFICULTY_SETTINGS, get_request_scheduler
+from batch_cli import generate_quiz
+
+# Listening address and worker pool size
+API_HOST = os.getenv("API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("API_PORT", "8000"))
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+
+# Jobs allowed to wait for a worker before new submissions get 503
+API_QUEUE_SIZE = int(os.getenv("API_QUEUE_SIZE", "32"))
+
+# Request limits and how long finished jobs stay available for polling
+API_MAX_UPLOAD_BYTES = int(os.getenv("API_MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+API_MAX_QUESTIONS = int(os.getenv("API_MAX_QUESTIONS", "50"))
+API_JOB_TTL_SECONDS = int(os.getenv("API_JOB_TTL_SECONDS", "3600"))
+
+
+class QuizJob:
+    """One submitted PDF and the quiz generated for it."""
+
+    def __init__(self, pdf_bytes, num_questions, difficulty, topic):
+        self.id = uuid.uuid4().hex
+        self.pdf_bytes = pdf_bytes
+        self.num_questions = num_questions
+        self.difficulty = difficulty
+        self.topic = topic
+        self.status = "queued"
+        self.questions = []
+        self.failed = 0
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.extracted_at = None
+        self.finished_at = None
+
+    def run(self):
+        """Extract and generate on the calling worker thread."""
+        self.started_at = time.time()
+        self.status = "running"
+        try:
+            generator = AimockMCQGenerator()
+            text = generator.extract_text_from_pdf(io.BytesIO(self.pdf_bytes))
+            self.extracted_at = time.time()
+            if not text.strip():
+                raise ValueError("no text could be extracted from the PDF")
+
+            document = {"num_questions": self.num_questions, "difficulty": self.difficulty, "topic": self.topic}
+            result = generate_quiz(document, generator.last_pdf_hash, text, use_bank=True)
+            self.questions = result["questions"]
+            self.failed = result["failed"]
+            self.status = "done" if self.questions else "failed"
+            if not self.questions:
+                self.error = "no questions could be generated"
+        except Exception as e:
+            logger.error(f"API job {self.id} failed: {e}")
+            self.status = "failed"
+            self.error = str(e)
+        finally:
+            self.pdf_bytes = None
+            self.finished_at = time.time()
+
+    def timings(self):
+        """Seconds spent queued, extracting, generating and in total, as far as known."""
+        def span(start, end):
+            if start is None:
+                return None
+            return round((end or time.time()) - start, 3)
+
+        return {
+            "queued_seconds": span(self.submitted_at, self.started_at),
+            "extract_seconds": span(self.started_at, self.extracted_at),
+            "generate_seconds": span(self.extracted_at, self.finished_at),
+            "total_seconds": span(self.submitted_at, self.finished_at),
+        }
+
+    def to_dict(self):
+        result = {
+            "job_id": self.id,
+            "status": self.status,
+            "num_questions": self.num_questions,
+            "difficulty": self.difficulty,
+            "topic": self.topic,
+            "timings": self.timings(),
+        }
+        if self.status in ("done", "failed"):
+            result.update(questions=self.questions, failed=self.failed, error=self.error)
+        return result
+
+
+class JobQueue:
+    """Bounded job queue drained by worker threads, plus the table jobs are polled from."""
+
+    def __init__(self, workers=API_WORKERS, max_queued=API_QUEUE_SIZE, ttl_seconds=API_JOB_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._queue = queue.Queue(maxsize=max(1, max_queued))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"api-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+                logger.info(f"API job {job.id} {job.status} in {job.timings()['total_seconds']}s")
+            finally:
+                self._queue.task_done()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, job):
+        """Queue job and return True, or return False at once if the queue is full."""
+        with self._lock:
+            self._expire()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                return False
+            self._jobs[job.id] = job
+            return True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "queued": self._queue.qsize(),
+            "queue_size": self._queue.maxsize,
+            "workers": len(self._workers),
+            "jobs": {status: statuses.count(status) for status in ("queued", "running", "done", "failed")},
+            "scheduler": get_request_scheduler().stats(),
+        }
+
+
+class QuizAPIHandler(BaseHTTPRequestHandler):
+    """Routes /jobs and /stats requests to the server's JobQueue."""
+
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message, headers=None):
+        self.send_json(status, {"error": message}, headers)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self.send_error_json(404, "not found")
+            return
+
+        if self.headers.get("Content-Length") is None:
+            self.send_error_json(411, "Content-Length is required")
+            self.close_connection = True
+            return
+        try:
+            length = int(self.headers["Content-Length"])
+        except ValueError:
+            length = -1
+        if length <= 0:
+            # Never read an unknown or empty body; rfile.read(-1) would wait for the client to hang up
+            self.send_error_json(400, "Content-Length must be a positive integer")
+            self.close_connection = True
+            return
+        if length > API_MAX_UPLOAD_BYTES:
+            self.send_error_json(413, f"PDF larger than {API_MAX_UPLOAD_BYTES} bytes")
+            self.close_connection = True
+            return
+        pdf_bytes = self.rfile.read(length)
+        if not pdf_bytes.startswith(b"%PDF"):
+            self.send_error_json(400, "request body must be a PDF file")
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            num_questions = int(params.get("num_questions", "10"))
+        except ValueError:
+            self.send_error_json(400, "num_questions must be an integer")
+            return
+        if not 1 <= num_questions <= API_MAX_QUESTIONS:
+            self.send_error_json(400, f"num_questions must be between 1 and {API_MAX_QUESTIONS}")
+            return
+        difficulty = params.get("difficulty", "Medium")
+        if difficulty not in DIFFICULTY_SETTINGS:
+            self.send_error_json(400, f"difficulty must be one of {', '.join(DIFFICULTY_SETTINGS)}")
+            return
+
+        job = QuizJob(pdf_bytes, num_questions, difficulty, params.get("topic") or None)
+        if not self.server.jobs.submit(job):
+            self.send_error_json(503, "job queue is full", {"Retry-After": str(self.server.retry_after)})
+            return
+        self.send_json(202, {"job_id": job.id, "status": job.status}, {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/stats":
+            self.send_json(200, self.server.jobs.stats())
+            return
+
+        prefix, _, job_id = path.rpartition("/")
+        job = self.server.jobs.get(job_id) if prefix == "/jobs" else None
+        if job is None:
+            self.send_error_json(404, "no such job")
+            return
+        self.send_json(200, job.to_dict())
+
+
+class QuizAPIServer(ThreadingHTTPServer):
+    """Threaded HTTP server that owns the job queue its handlers submit to."""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers=API_WORKERS, max_queued=API_QUEUE_SIZE, retry_after=5):
+        super().__init__(address, QuizAPIHandler)
+        self.jobs = JobQueue(workers, max_queued)
+        self.retry_after = retry_after
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve quiz generation jobs over HTTP.")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="jobs generated at once")
+    parser.add_argument("--queue-size", type=int, default=API_QUEUE_SIZE,
+                        help="jobs allowed to wait before submissions are rejected with 503")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("OPENAI_API_KEY"):
+        parser.error("OPENAI_API_KEY must be set")
+
+    server = QuizAPIServer((args.host, args.port), args.workers, args.queue_size)
+    logger.info(f"Quiz API listening on http://{args.host}:{server.server_address[1]} "
+                f"({args.workers} workers, queue of {args.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,29 @@
+import io
 import os
+import re
 import sys
-import PyPDF2
+import json
+import zlib
+import base64
+import math
+import queue
+import heapq
 import random
+import sqlite3
 import logging
+import time
+import hashlib
 import datetime
+import threading
+import httpx
 import streamlit as st
+from array import array
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from dotenv import load_dotenv
-from openai import OpenAI
+from pdf_extraction import iter_page_texts, clean_text
+from openai import OpenAI, BadRequestError, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image, Table, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -16,6 +33,12 @@ from reportlab.graphics.shapes import Drawing
 from reportlab.graphics.charts.piecharts import Pie
 from reportlab.graphics.charts.barcharts import VerticalBarChart
 
+# tiktoken is optional; without it token counts are estimated from text length
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -27,6 +50,89 @@ logger = logging.getLogger("PDF Quiz Generator Application Using AI")
 # Load environment variables
 load_dotenv()
 
+# Maximum number of question-generation requests one quiz keeps in flight at once
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "5"))
+
+# Number of questions requested per API call (1 disables batch mode)
+QUESTIONS_PER_REQUEST = int(os.getenv("QUESTIONS_PER_REQUEST", "4"))
+
+# Extracted-text cache: in-process LRU size plus optional on-disk store
+PDF_CACHE_MAX_ENTRIES = int(os.getenv("PDF_CACHE_MAX_ENTRIES", "32"))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", "")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Topic retrieval: candidate passages kept per requested question
+TOPIC_CANDIDATES_PER_QUESTION = int(os.getenv("TOPIC_CANDIDATES_PER_QUESTION", "3"))
+
+# Near-duplicate filtering: character 5-gram Jaccard similarity above which a question is rejected
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.6"))
+MAX_DUPLICATE_REPLACEMENTS = int(os.getenv("MAX_DUPLICATE_REPLACEMENTS", "2"))
+
+# SQLite file holding every generated question, keyed by document hash
+QUESTION_BANK_PATH = os.getenv("QUESTION_BANK_PATH", "question_bank.sqlite3")
+
+# LLM response cache: SQLite file (empty disables), entry lifetime and size cap
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Ask the API for JSON output (response_format) where the model supports it
+OPENAI_JSON_MODE = os.getenv("OPENAI_JSON_MODE", "1") == "1"
+
+# Models that rejected response_format during this run; they get plain prompts
+JSON_MODE_UNSUPPORTED_MODELS = set()
+
+# Client-side pacing for the OpenAI account limits (0 disables a limit)
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+
+# Ceiling on OpenAI requests in flight across every session in the process
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "20"))
+
+# Shared HTTP connection pool for the OpenAI client
+OPENAI_POOL_MAX_CONNECTIONS = int(os.getenv("OPENAI_POOL_MAX_CONNECTIONS", "50"))
+OPENAI_POOL_MAX_KEEPALIVE = int(os.getenv("OPENAI_POOL_MAX_KEEPALIVE", "20"))
+OPENAI_POOL_KEEPALIVE_SECONDS = float(os.getenv("OPENAI_POOL_KEEPALIVE_SECONDS", "60"))
+
+# Record/replay of API traffic for repeatable benchmarks: cassette file (empty
+# disables), "record" or "replay", and "original" or "zero" replay latency
+OPENAI_CASSETTE = os.getenv("OPENAI_CASSETTE", "")
+OPENAI_CASSETTE_MODE = os.getenv("OPENAI_CASSETTE_MODE", "replay")
+OPENAI_CASSETTE_LATENCY = os.getenv("OPENAI_CASSETTE_LATENCY", "original")
+
+# Seed for passage sampling and duplicate detection so repeated runs send the
+# same prompts; empty keeps them random
+QUIZ_RANDOM_SEED = int(os.getenv("QUIZ_RANDOM_SEED", "")) if os.getenv("QUIZ_RANDOM_SEED", "") else None
+
+# Prompt budgeting: passage and feedback-prompt caps, in tokens
+PASSAGE_TOKEN_LIMIT = int(os.getenv("PASSAGE_TOKEN_LIMIT", "300"))
+FEEDBACK_PROMPT_TOKEN_LIMIT = int(os.getenv("FEEDBACK_PROMPT_TOKEN_LIMIT", "2000"))
+
+# Background report builds: worker threads shared by all sessions, and how often
+# the results page checks on a running build
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
+REPORT_POLL_SECONDS = float(os.getenv("REPORT_POLL_SECONDS", "1"))
+
+# Difficulty-based prompting
+DIFFICULTY_SETTINGS = {
+    "Easy": {
+        "prompt": "Generate straightforward distractors with clear differences from the correct answer",
+        "temp": 0.5
+    },
+    "Medium": {
+        "prompt": "Generate moderately challenging distractors that are plausible but incorrect",
+        "temp": 0.7
+    },
+    "Hard": {
+        "prompt": "Generate sophisticated distractors that require careful analysis to distinguish from the correct answer",
+        "temp": 0.8
+    }
+}
+
+# Fields every question in a batch response must have; build_mcq validates their values
+BATCH_QUESTION_FIELDS = ("passage", "question", "options", "correct", "explanation")
+
 # Custom CSS for enhanced UI
 def load_custom_css():
     # Get the current theme color
@@ -313,6 +419,1313 @@ def load_custom_css():
 
 
 
+def hash_pdf_bytes(pdf_bytes):
+    """Return the content address (SHA-256 hex digest) of a PDF's raw bytes."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+class PDFTextCache:
+    """Thread-safe cache of extracted PDF text keyed by the hash of the PDF bytes.
+
+    Entries live in an in-process LRU and, when cache_dir is set, in a directory
+    of text files whose total size is capped by evicting least recently used files.
+    """
+    
+    def __init__(self, max_entries=32, cache_dir="", max_bytes=200 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.txt")
+    
+    def get(self, key):
+        """Return cached text for key, or None on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        
+        text = None
+        if self.cache_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = f.read()
+                # Touch the file so disk eviction sees it as recently used
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not read PDF cache entry {key}: {e}")
+        
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, text)
+            return text
+    
+    def put(self, key, text):
+        """Store text under key in memory and, if configured, on disk."""
+        with self._lock:
+            self._remember(key, text)
+        
+        if self.cache_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+                self._evict_disk()
+            except OSError as e:
+                logger.warning(f"Could not write PDF cache entry {key}: {e}")
+    
+    def _remember(self, key, text):
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def _evict_disk(self):
+        """Delete least recently used files until the directory fits in max_bytes."""
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".txt"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class PassageIndex:
+    """Compact index of the informative passages in a document.
+
+    The text is split on ". " once; passages with more than 10 words are kept as
+    parallel arrays of start/end offsets and word counts, so sampling a passage
+    is O(1) and does not rescan the document.
+    """
+    
+    MIN_WORDS = 10
+    
+    def __init__(self, content):
+        self.content = content
+        self.starts = array("I")
+        self.ends = array("I")
+        self.word_counts = array("I")
+        
+        start = 0
+        length = len(content)
+        while start <= length:
+            end = content.find(". ", start)
+            if end == -1:
+                end = length
+            word_count = len(content[start:end].split())
+            if word_count > self.MIN_WORDS:
+                self.starts.append(start)
+                self.ends.append(end)
+                self.word_counts.append(word_count)
+            start = end + 2
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def passage(self, i):
+        """Return passage i as a sentence ending in a period."""
+        return self.content[self.starts[i]:self.ends[i]] + "."
+    
+    def random_passage(self):
+        return self.passage(random.randrange(len(self.starts)))
+    
+    def sample(self, count):
+        """Return count passages, distinct where the document has enough of them."""
+        size = len(self.starts)
+        ids = random.sample(range(size), min(count, size))
+        while len(ids) < count:
+            ids.append(random.randrange(size))
+        return [self.passage(i) for i in ids]
+
+
+class PassageSampler:
+    """Draws passages from a PassageIndex without replacement, spread across the document.
+
+    The document is cut into num_sections equal slices by character offset and
+    draws rotate through the slices, so a quiz of N questions covers the whole
+    text instead of clustering. Passages are only reused once every one has been
+    drawn. Safe to share between worker threads. A seed makes the draws repeatable.
+    """
+    
+    def __init__(self, passage_index, num_sections=8, candidates=None, seed=None):
+        self.passage_index = passage_index
+        self._random = random.Random(seed) if seed is not None else random
+        self.num_sections = max(1, min(num_sections, len(passage_index) or 1))
+        self.candidates = list(range(len(passage_index))) if candidates is None else list(candidates)
+        self._lock = threading.Lock()
+        self._refill()
+    
+    def _refill(self):
+        content_length = max(1, len(self.passage_index.content))
+        sections = [[] for _ in range(self.num_sections)]
+        for i in self.candidates:
+            sections[self.passage_index.starts[i] * self.num_sections // content_length].append(i)
+        for section in sections:
+            self._random.shuffle(section)
+        self._sections = [section for section in sections if section]
+        self._random.shuffle(self._sections)
+        self._next_section = 0
+    
+    def draw(self, count=1):
+        """Return count passages, taking one from each section in turn."""
+        if not self.candidates:
+            return []
+        
+        paragraphs = []
+        with self._lock:
+            while len(paragraphs) < count:
+                if not self._sections:
+                    self._refill()
+                self._next_section %= len(self._sections)
+                section = self._sections[self._next_section]
+                paragraphs.append(self.passage_index.passage(section.pop()))
+                if section:
+                    self._next_section += 1
+                else:
+                    del self._sections[self._next_section]
+        return paragraphs
+
+
+class BM25Index:
+    """In-memory inverted index over a PassageIndex, ranked with Okapi BM25.
+
+    Built once per document so a topic query scores only the passages that share
+    a term with it, instead of spending API calls on random passages.
+    """
+    
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+    STOPWORDS = frozenset(
+        "a an and are as at be by for from has have in is it its of on or that the "
+        "their this to was were which with".split()
+    )
+    
+    def __init__(self, passage_index, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = array("I")
+        # term -> (passage ids, term frequencies)
+        self.postings = {}
+        
+        for i in range(len(passage_index)):
+            terms = self.tokenize(passage_index.passage(i))
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                ids, tfs = self.postings.setdefault(term, (array("I"), array("I")))
+                ids.append(i)
+                tfs.append(tf)
+        
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+    
+    @classmethod
+    def tokenize(cls, text):
+        return [t for t in cls.TOKEN_PATTERN.findall(text.lower()) if t not in cls.STOPWORDS]
+    
+    def search(self, query, k=10):
+        """Return up to k (passage id, score) pairs for query, best first."""
+        n = len(self.doc_lengths)
+        scores = {}
+        
+        for term in set(self.tokenize(query)):
+            if term not in self.postings:
+                continue
+            ids, tfs = self.postings[term]
+            idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            for i, tf in zip(ids, tfs):
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[i] / self.avg_doc_length)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+class DuplicateQuestionFilter:
+    """Rejects questions that are near-duplicates of ones already accepted.
+
+    Each question is reduced to character 5-gram shingles of its text plus
+    correct option, which survive the small rewordings ("the"/"a", plurals) that
+    break word shingles, and summarised by a 128-hash MinHash signature. LSH
+    banding (32 bands of 4 rows) makes pairs near the threshold share a band
+    with high probability, and only those candidates get an exact Jaccard check,
+    so cost stays linear in the number of questions. Safe to share between
+    worker threads.
+    """
+    
+    NUM_HASHES = 128
+    BANDS = 32
+    SHINGLE_SIZE = 5
+    # Mersenne prime modulus for the (a * x + b) mod p hash family
+    PRIME = (1 << 61) - 1
+    
+    def __init__(self, threshold=0.6, seed=None):
+        self.threshold = threshold
+        rng = random.Random(seed)
+        self._hashes = [(rng.randrange(1, self.PRIME), rng.randrange(self.PRIME)) for _ in range(self.NUM_HASHES)]
+        self._rows = self.NUM_HASHES // self.BANDS
+        self._buckets = {}
+        self._shingles = []
+        self._lock = threading.Lock()
+        self.rejected = 0
+    
+    def _shingle(self, mcq):
+        text = " ".join(re.findall(r"\w+", f"{mcq['question']} {mcq['correct_option']}".lower()))
+        size = self.SHINGLE_SIZE
+        # crc32 rather than hash() so signatures do not change with PYTHONHASHSEED
+        return {zlib.crc32(text[i:i + size].encode()) for i in range(max(1, len(text) - size + 1))}
+    
+    def _signature(self, shingles):
+        prime = self.PRIME
+        return tuple(min((a * shingle + b) % prime for shingle in shingles) for a, b in self._hashes)
+    
+    def add(self, mcq):
+        """Record mcq and return True, or return False if it duplicates an accepted question."""
+        shingles = self._shingle(mcq)
+        signature = self._signature(shingles)
+        bands = [(b, signature[b * self._rows:(b + 1) * self._rows]) for b in range(self.BANDS)]
+        
+        with self._lock:
+            candidates = set()
+            for band in bands:
+                candidates.update(self._buckets.get(band, ()))
+            
+            for i in candidates:
+                other = self._shingles[i]
+                similarity = len(shingles & other) / len(shingles | other)
+                if similarity >= self.threshold:
+                    self.rejected += 1
+                    logger.info(f"Rejected near-duplicate question ({similarity:.2f} similar): {mcq['question']}")
+                    return False
+            
+            self._shingles.append(shingles)
+            for band in bands:
+                self._buckets.setdefault(band, []).append(len(self._shingles) - 1)
+            return True
+
+
+@st.cache_resource
+def get_pdf_text_cache():
+    """Process-wide extracted-text cache shared by every session."""
+    return PDFTextCache(PDF_CACHE_MAX_ENTRIES, PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES)
+
+
+class QuestionBank:
+    """SQLite-backed store of generated questions, keyed by document hash, difficulty and topic.
+
+    Quiz setup serves questions from the bank first and only calls the API for
+    the shortfall. Safe to share between threads.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS questions (
+                    id INTEGER PRIMARY KEY,
+                    doc_hash TEXT NOT NULL,
+                    difficulty TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    paragraph TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    UNIQUE (doc_hash, difficulty, question)
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_questions_lookup ON questions (doc_hash, difficulty, topic)"
+            )
+            # Per-connection scratch table for fetch's exclusions, which can outgrow SQLite's variable limit
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS excluded_questions (question TEXT PRIMARY KEY)")
+    
+    @staticmethod
+    def _normalize_topic(topic):
+        return (topic or "").strip().lower()
+    
+    def add(self, doc_hash, topic, mcqs):
+        """Store question dicts for a document; questions already in the bank are ignored."""
+        rows = [
+            (doc_hash, mcq["difficulty"], self._normalize_topic(topic), mcq["paragraph"], mcq["question"],
+             json.dumps(mcq), datetime.datetime.now().timestamp())
+            for mcq in mcqs
+        ]
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO questions "
+                    "(doc_hash, difficulty, topic, paragraph, question, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store questions in the bank: {e}")
+    
+    def fetch(self, doc_hash, difficulty, topic, limit, exclude=()):
+        """Return up to limit random stored question dicts matching the document, difficulty and topic.
+
+        Questions whose text is in exclude (ones the user has already been served)
+        are skipped.
+        """
+        try:
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM excluded_questions")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO excluded_questions (question) VALUES (?)",
+                    ((question,) for question in exclude)
+                )
+                rows = self._conn.execute(
+                    "SELECT payload FROM questions WHERE doc_hash = ? AND difficulty = ? AND topic = ? "
+                    "AND NOT EXISTS (SELECT 1 FROM excluded_questions e WHERE e.question = questions.question) "
+                    "ORDER BY RANDOM() LIMIT ?",
+                    (doc_hash, difficulty, self._normalize_topic(topic), limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not read questions from the bank: {e}")
+            return []
+        return [json.loads(payload) for (payload,) in rows]
+
+
+@st.cache_resource
+def get_question_bank():
+    """Process-wide question bank shared by every session."""
+    return QuestionBank(QUESTION_BANK_PATH)
+
+
+class LLMResponseCache:
+    """Disk-backed cache of chat completion texts with a TTL and LRU eviction.
+
+    Entries are keyed by a hash of the model, messages, temperature and
+    max_tokens. Expired entries are treated as misses, and once the stored
+    responses exceed max_bytes the least recently used ones are evicted.
+    Safe to share between threads.
+    """
+    
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    
+    @staticmethod
+    def make_key(model, messages, temperature, max_tokens, **extra):
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens, **extra}
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def get(self, key):
+        """Return the cached response text for key, or None on a miss or expiry."""
+        now = datetime.datetime.now().timestamp()
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute("SELECT response, size, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[2] > self.ttl_seconds:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._total_bytes -= row[1]
+                    row = None
+                if row is None:
+                    self.misses += 1
+                    return None
+                self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+    
+    def put(self, key, response):
+        """Store a response text, evicting least recently used entries beyond max_bytes."""
+        now = datetime.datetime.now().timestamp()
+        size = len(response.encode("utf-8"))
+        try:
+            with self._lock, self._conn:
+                old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                    (key, response, size, now, now)
+                )
+                self._total_bytes += size - (old[0] if old else 0)
+                
+                while self._total_bytes > self.max_bytes:
+                    rows = self._conn.execute(
+                        "SELECT key, size FROM responses WHERE key != ? ORDER BY last_access LIMIT 64", (key,)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    for old_key, old_size in rows:
+                        if self._total_bytes <= self.max_bytes:
+                            break
+                        self._conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                        self._total_bytes -= old_size
+                        self.evictions += 1
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+    
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "bytes": self._total_bytes}
+
+
+@st.cache_resource
+def get_llm_response_cache():
+    """Process-wide LLM response cache, or None when LLM_CACHE_PATH is empty."""
+    if not LLM_CACHE_PATH:
+        return None
+    return LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES)
+
+
+# Feedback shown when an AI feedback request fails
+FEEDBACK_FALLBACK = {
+    "patterns": "Unable to generate pattern analysis.",
+    "general_feedback": "Thank you for taking the test. Keep practicing to improve your knowledge."
+}
+
+
+def feedback_attempt_key(questions, user_answers, final_score):
+    """Identify one quiz attempt so its AI feedback can be computed once and reused."""
+    payload = json.dumps([[q["question"] for q in questions], user_answers, final_score])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TokenBucket:
+    """Token bucket refilled at rate_per_minute, holding up to ten seconds of budget."""
+    
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, rate_per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, amount=1.0):
+        """Block until amount can be taken from the bucket, then take it."""
+        # A request larger than the bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestScheduler:
+    """Paces, limits and retries OpenAI requests shared across sessions.
+
+    Requests wait on request and token buckets sized from OPENAI_RPM_LIMIT and
+    OPENAI_TPM_LIMIT. In-flight requests are capped by an adaptive limit of at
+    most OPENAI_MAX_CONCURRENCY that is halved whenever the API throttles and
+    grows back by one per window of successes; a streamed response holds its
+    slot until it is read to the end or closed. Rate limits honour Retry-After;
+    timeouts, connection and server errors back off exponentially with full
+    jitter.
+    """
+    
+    def __init__(self, rpm_limit=0, tpm_limit=0, max_concurrency=OPENAI_MAX_CONCURRENCY, max_retries=5,
+                 base_delay=0.5, max_delay=30.0):
+        self.request_bucket = TokenBucket(rpm_limit) if rpm_limit > 0 else None
+        self.token_bucket = TokenBucket(tpm_limit) if tpm_limit > 0 else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.concurrency = float(self.max_concurrency)
+        self.in_flight = 0
+        self.throttled = 0
+        self.retries = 0
+        self._successes = 0
+        self._cond = threading.Condition()
+    
+    @staticmethod
+    def _retry_after(error):
+        """Return the server's Retry-After delay in seconds, if it sent one."""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000.0
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass
+        return None
+    
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+    
+    def _enter(self):
+        with self._cond:
+            while self.in_flight >= int(self.concurrency):
+                self._cond.wait()
+            self.in_flight += 1
+    
+    def _exit(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self._successes = 0
+                self.concurrency = max(1.0, self.concurrency / 2)
+                logger.warning(f"Rate limited; lowering concurrency to {int(self.concurrency)}")
+            else:
+                self._successes += 1
+                if self._successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self._successes = 0
+                    self.concurrency += 1
+            self._cond.notify_all()
+    
+    def call(self, fn, estimated_tokens=0, stream=False):
+        """Run fn() under pacing and concurrency limits, retrying transient failures.
+
+        With stream, fn returns a response stream and the result is a
+        ScheduledStream that keeps the concurrency slot until it is consumed.
+        """
+        attempt = 0
+        while True:
+            if self.request_bucket:
+                self.request_bucket.acquire(1)
+            if self.token_bucket and estimated_tokens:
+                self.token_bucket.acquire(estimated_tokens)
+            
+            self._enter()
+            try:
+                result = fn()
+            except RateLimitError as e:
+                self._exit(throttled=True)
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._retry_after(e)
+                delay = max(delay, self._backoff(attempt)) if delay is not None else self._backoff(attempt)
+            except (APITimeoutError, APIConnectionError, InternalServerError) as e:
+                self._exit()
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Transient OpenAI error ({e}); retrying in {delay:.1f}s")
+            except BaseException:
+                self._exit()
+                raise
+            else:
+                if stream:
+                    return ScheduledStream(result, self._exit)
+                self._exit()
+                return result
+            
+            attempt += 1
+            with self._cond:
+                self.retries += 1
+            time.sleep(delay)
+    
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "retries": self.retries
+            }
+
+
+class ScheduledStream:
+    """Iterates a streamed response, releasing its scheduler slot once the stream ends or is closed."""
+    
+    def __init__(self, stream, release):
+        self.stream = stream
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+    
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            close = getattr(self.stream, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+
+@st.cache_resource
+def get_request_scheduler():
+    """Process-wide request scheduler shared by every session."""
+    return RequestScheduler(OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, OPENAI_MAX_CONCURRENCY, OPENAI_MAX_RETRIES)
+
+
+class PoolStatsTransport(httpx.BaseTransport):
+    """HTTP transport that counts requests passing through a pooled inner transport."""
+    
+    def __init__(self, transport):
+        self.transport = transport
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+    
+    def handle_request(self, request):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return self.transport.handle_request(request)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+    
+    def close(self):
+        self.transport.close()
+    
+    def stats(self):
+        with self._lock:
+            stats = {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight
+            }
+        # httpx does not expose its pool publicly; read httpcore's connections if present
+        connections = getattr(getattr(self.transport, "_pool", None), "connections", None)
+        if connections is not None:
+            stats["open_connections"] = len(connections)
+            stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        return stats
+
+
+class RecordingStream(httpx.SyncByteStream):
+    """Passes a response body through while noting when each chunk arrived."""
+    
+    def __init__(self, stream, started, on_close):
+        self.stream = stream
+        self.started = started
+        self.chunks = []
+        self._on_close = on_close
+        self._closed = False
+    
+    def __iter__(self):
+        for chunk in self.stream:
+            self.chunks.append((time.perf_counter() - self.started, chunk))
+            yield chunk
+    
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close(self.chunks)
+
+
+class ReplayStream(httpx.SyncByteStream):
+    """Yields a recorded response body, optionally at its recorded pace."""
+    
+    def __init__(self, chunks, started, realtime):
+        self.chunks = chunks
+        self.started = started
+        self.realtime = realtime
+    
+    def __iter__(self):
+        for offset, data in self.chunks:
+            if self.realtime:
+                delay = self.started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            yield base64.b64decode(data)
+
+
+class CassetteWriter:
+    """Appends recorded exchanges to one cassette file; opened once per path."""
+    
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+    
+    def write(self, entry):
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+
+@st.cache_resource
+def get_cassette_writer(path):
+    """Process-wide writer for a cassette, shared so one client never truncates another's recordings."""
+    return CassetteWriter(path)
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """Records API exchanges to a JSONL cassette, or replays them without a network.
+
+    In record mode requests go to the inner transport and each response is saved
+    as it streams, with the time its headers and every chunk arrived. In replay
+    mode the inner transport is never used: responses are matched on method, path
+    and request body, ignoring max_tokens (which adapts to observed usage), and
+    served with their original timing or none. Identical requests replay their
+    recordings in order, reusing the last once they run out; a request that was
+    never recorded gets a 400 so it fails fast instead of being retried.
+    """
+    
+    IGNORED_FIELDS = ("max_tokens",)
+    
+    def __init__(self, transport, path, mode="replay", latency="original"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', not {mode!r}")
+        self.transport = transport
+        self.path = path
+        self.mode = mode
+        self.realtime = latency != "zero"
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self._recordings = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        
+        if mode == "record":
+            # Every API key's client records through the same writer
+            self._writer = get_cassette_writer(path)
+        else:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._recordings.setdefault(entry["key"], deque()).append(entry)
+            logger.info(f"Replaying {sum(map(len, self._recordings.values()))} API responses from {path}")
+    
+    @classmethod
+    def request_key(cls, request):
+        body = request.read()
+        try:
+            payload = json.loads(body)
+            for field in cls.IGNORED_FIELDS:
+                payload.pop(field, None)
+            body = json.dumps(payload, sort_keys=True).encode("utf-8")
+        except (ValueError, AttributeError):
+            pass
+        return hashlib.sha256(f"{request.method} {request.url.path}\n".encode("utf-8") + body).hexdigest()
+    
+    def handle_request(self, request):
+        key = self.request_key(request)
+        started = time.perf_counter()
+        if self.mode == "replay":
+            return self._replay(key, request, started)
+        
+        response = self.transport.handle_request(request)
+        headers_at = time.perf_counter() - started
+        
+        def save(chunks):
+            entry = {
+                "key": key,
+                "method": request.method,
+                "path": request.url.path,
+                "status": response.status_code,
+                "headers": [[name, value] for name, value in response.headers.multi_items()],
+                "headers_at": round(headers_at, 4),
+                "chunks": [[round(offset, 4), base64.b64encode(data).decode("ascii")] for offset, data in chunks]
+            }
+            self._writer.write(entry)
+            with self._lock:
+                self.recorded += 1
+        
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=RecordingStream(response.stream, started, save),
+            extensions=response.extensions
+        )
+    
+    def _replay(self, key, request, started):
+        with self._lock:
+            recordings = self._recordings.get(key)
+            entry = (recordings.popleft() if len(recordings) > 1 else recordings[0]) if recordings else None
+            if entry is None:
+                self.misses += 1
+            else:
+                self.replayed += 1
+        
+        if entry is None:
+            logger.warning(f"No recorded response for {request.method} {request.url.path} in {self.path}")
+            return httpx.Response(400, json={"error": {
+                "message": f"No recorded response for this request in cassette {self.path}",
+                "type": "invalid_request_error"
+            }})
+        
+        if self.realtime:
+            time.sleep(entry["headers_at"])
+        return httpx.Response(
+            status_code=entry["status"],
+            headers=entry["headers"],
+            stream=ReplayStream(entry["chunks"], started, self.realtime)
+        )
+    
+    def close(self):
+        # The writer is shared with other clients and stays open
+        self.transport.close()
+    
+    def stats(self):
+        with self._lock:
+            return {"mode": self.mode, "recorded": self.recorded, "replayed": self.replayed, "misses": self.misses}
+
+
+class SharedOpenAIClient:
+    """One OpenAI client and keep-alive connection pool shared by every session.
+
+    Connections are reused across Generate clicks, reruns and users, so calls
+    skip new TCP and TLS handshakes. The transport records pool statistics for
+    sizing the pool under concurrent use.
+    """
+    
+    def __init__(self, api_key):
+        self.limits = httpx.Limits(
+            max_connections=OPENAI_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=OPENAI_POOL_KEEPALIVE_SECONDS
+        )
+        self.transport = PoolStatsTransport(httpx.HTTPTransport(limits=self.limits))
+        # Optionally record every exchange to, or serve it from, OPENAI_CASSETTE
+        self.cassette = None
+        if OPENAI_CASSETTE:
+            self.cassette = CassetteTransport(self.transport, OPENAI_CASSETTE, OPENAI_CASSETTE_MODE, OPENAI_CASSETTE_LATENCY)
+        self.http_client = httpx.Client(transport=self.cassette or self.transport, timeout=httpx.Timeout(60.0, connect=10.0))
+        # Retries are handled by the shared RequestScheduler, not the client
+        self.client = OpenAI(api_key=api_key, max_retries=0, http_client=self.http_client)
+    
+    def stats(self):
+        stats = {**self.transport.stats(), "max_connections": self.limits.max_connections}
+        if self.cassette is not None:
+            stats["cassette"] = self.cassette.stats()
+        return stats
+
+
+@st.cache_resource
+def get_openai_client(api_key):
+    """Process-wide OpenAI client for an API key, shared by every session."""
+    return SharedOpenAIClient(api_key)
+
+
+class TokenBudget:
+    """Token counting, prompt trimming and max_tokens sizing for API calls.
+
+    Completion lengths are recorded per kind of call ("mcq", "feedback", ...).
+    Once MIN_SAMPLES have been seen, max_tokens is sized from the observed 95th
+    percentile plus headroom instead of a fixed guess. Budgets are rounded up to
+    multiples of 50 so response cache keys stay stable. Safe to share between threads.
+    """
+    
+    MIN_SAMPLES = 20
+    HEADROOM = 1.25
+    
+    def __init__(self, model):
+        self.model = model
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        self._samples = {}
+        self._lock = threading.Lock()
+    
+    def count_tokens(self, text):
+        if self._encoding is not None:
+            return len(self._encoding.encode(text))
+        return len(text) // 4 + 1
+    
+    def trim(self, text, max_tokens):
+        """Cut text to at most max_tokens, at a word boundary, marking the cut with "..."."""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self._encoding is not None:
+            trimmed = self._encoding.decode(self._encoding.encode(text)[:max_tokens])
+        else:
+            trimmed = text[:max_tokens * 4]
+        return trimmed.rsplit(" ", 1)[0].rstrip(" .,;:") + "..."
+    
+    def max_tokens_for(self, kind, default, items=1):
+        """Return the completion budget for a call producing items outputs of this kind."""
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < self.MIN_SAMPLES:
+            per_item = default
+        else:
+            p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+            # Never shrink below half the default, never grow past twice it
+            per_item = min(max(p95 * self.HEADROOM, default / 2), default * 2)
+        return int(math.ceil(per_item * items / 50.0) * 50)
+    
+    def record(self, kind, prompt_tokens, completion_tokens, items=1, truncated=False):
+        """Log one call's token usage and add it to the output-length distribution."""
+        logger.info(f"Token usage [{kind}]: prompt={prompt_tokens} completion={completion_tokens}"
+                    f"{' (truncated)' if truncated else ''}")
+        per_item = completion_tokens / max(1, items)
+        if truncated:
+            # The budget was too small; record a longer sample so the next budget grows
+            per_item *= 1.5
+        with self._lock:
+            self._samples.setdefault(kind, deque(maxlen=500)).append(per_item)
+
+
+@st.cache_resource
+def get_token_budget(model):
+    """Process-wide token budget for a model, shared by every session."""
+    return TokenBudget(model)
+
+
+class ParseStats:
+    """Thread-safe counters of how model responses were parsed.
+
+    Every question request records one outcome ("json", "text_fallback" or a
+    "failed: <reason>" entry), so API calls wasted on unparseable output are visible.
+    """
+    
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+    
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+    
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+    
+    def failure_rate(self):
+        with self._lock:
+            total = sum(self._counts.values())
+            failed = sum(n for outcome, n in self._counts.items() if outcome.startswith("failed"))
+        return failed / total if total else 0.0
+
+
+@st.cache_resource
+def get_parse_stats():
+    """Process-wide response parse counters."""
+    return ParseStats()
+
+
+MCQ_FIELD_LINE = re.compile(r"^(question|correct(?: answer| option)?|answer|explanation)\s*[:\-]\s*(.*)$", re.IGNORECASE)
+MCQ_OPTION_LINE = re.compile(r"^\(?([a-d])\s*[\.\):]\s*(.+)$", re.IGNORECASE)
+MCQ_OPTION_PREFIX = re.compile(r"^\(?[a-d]\s*[\.\)]\s+", re.IGNORECASE)
+MCQ_LABEL = re.compile(r"^\(?([a-d])[\.\):]?$", re.IGNORECASE)
+MCQ_LABELLED_TEXT = re.compile(r"^\(?([a-d])\s*[\.\):]\s+(.+)$", re.IGNORECASE)
+MCQ_LETTER = re.compile(r"\b(?:option|answer|choice)\s*(?:is\s*)?\(?([a-d])\b|\(([a-d])\)", re.IGNORECASE)
+
+
+def load_json_payload(text):
+    """Parse JSON from a model response, tolerating code fences and surrounding prose."""
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    
+    # Fall back to the outermost object or array in the text
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return None
+    start = min(starts)
+    end = text.rfind("}" if text[start] == "{" else "]")
+    try:
+        return json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_mcq_text(text):
+    """Parse the line-based "Question: / a. / Correct: / Explanation:" format in one pass.
+
+    Tolerates option labels like "A)", "(b)" or "c:", markdown bold, labels such as
+    "Correct answer: B." and multi-line questions or explanations.
+    """
+    fields = {"question": "", "options": {}, "correct": "", "explanation": ""}
+    current = None
+    
+    for raw_line in text.splitlines():
+        line = raw_line.replace("**", "").strip()
+        if not line:
+            continue
+        
+        field = MCQ_FIELD_LINE.match(line)
+        if field:
+            name = field.group(1).lower()
+            value = field.group(2).strip()
+            if name.startswith(("correct", "answer")):
+                fields["correct"] = value
+                current = None
+            else:
+                fields[name] = value
+                current = name
+            continue
+        
+        option = MCQ_OPTION_LINE.match(line)
+        if option and current != "explanation" and len(fields["options"]) < 4:
+            fields["options"].setdefault(option.group(1).lower(), option.group(2).strip())
+            current = None
+            continue
+        
+        if current:
+            # Continuation of a multi-line question or explanation
+            fields[current] += " " + line
+    
+    fields["options"] = [fields["options"][letter] for letter in "abcd" if letter in fields["options"]]
+    return fields
+
+
+def parse_mcq_response(text):
+    """Return (fields, parse mode) for a single-question response, trying JSON first."""
+    payload = load_json_payload(text)
+    if isinstance(payload, dict) and "question" in payload:
+        return payload, "json"
+    return parse_mcq_text(text), "text_fallback"
+
+
+def build_mcq(question, options, correct, explanation, paragraph, difficulty):
+    """Validate parsed fields and return the app's question dict, or raise ValueError."""
+    question = question.strip() if isinstance(question, str) else ""
+    if not question:
+        raise ValueError("missing question")
+    
+    if isinstance(options, dict):
+        options = [options.get(letter, options.get(letter.upper())) for letter in "abcd"]
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) and o.strip() for o in options):
+        raise ValueError("expected 4 options")
+    options = [MCQ_OPTION_PREFIX.sub("", o.strip()) for o in options]
+    
+    # Prompts ask for a letter, so a bare label always means that option, even
+    # when an option's text is itself a letter; option texts are matched next so
+    # an answer such as "A cell wall" is not mistaken for option a
+    correct = str(correct).strip()
+    lowered = [o.lower() for o in options]
+    label = MCQ_LABEL.match(correct)
+    labelled = MCQ_LABELLED_TEXT.match(correct)
+    phrased = MCQ_LETTER.search(correct) if len(correct) <= 20 else None
+    if label:
+        correct_answer = label.group(1).lower()
+    elif labelled:
+        # "b) Mitochondria": trust the text when it names an option, else the label
+        text = labelled.group(2).strip().lower()
+        correct_answer = "abcd"[lowered.index(text)] if text in lowered else labelled.group(1).lower()
+    elif correct.lower() in lowered:
+        # The model answered with the option text instead of its letter
+        correct_answer = "abcd"[lowered.index(correct.lower())]
+    elif phrased:
+        # Short phrasings such as "Option B" or "answer is (c)"
+        correct_answer = (phrased.group(1) or phrased.group(2)).lower()
+    else:
+        raise ValueError(f"invalid correct answer: {correct}")
+    
+    return {
+        "question": question,
+        "options": options,
+        "correct_answer": correct_answer,
+        "correct_option": options[ord(correct_answer) - ord('a')],
+        "explanation": str(explanation or "").strip(),
+        "difficulty": difficulty,
+        "paragraph": paragraph,
+    }
+
+
+class ReportTemplates:
+    """Report stylesheet, paragraph styles, table style and chart template, built once per process.
+
+    All of these are read-only while a document is built, so every report,
+    in any session or thread, reuses the same objects.
+    """
+    
+    def __init__(self):
+        self.styles = getSampleStyleSheet()
+        
+        # Create custom styles
+        self.title_style = ParagraphStyle(
+            'CustomTitle', 
+            parent=self.styles['Title'],
+            fontSize=24,
+            spaceAfter=20,
+            textColor=colors.darkblue
+        )
+        
+        self.subtitle_style = ParagraphStyle(
+            'SubTitle',
+            parent=self.styles['Heading1'],
+            fontSize=18,
+            textColor=colors.darkblue,
+            spaceAfter=12
+        )
+        
+        self.section_style = ParagraphStyle(
+            'SectionTitle',
+            parent=self.styles['Heading2'],
+            fontSize=14,
+            textColor=colors.darkblue,
+            spaceBefore=15,
+            spaceAfter=10
+        )
+        
+        self.question_style = ParagraphStyle(
+            'QuestionStyle',
+            parent=self.styles['Heading3'],
+            fontSize=12,
+            textColor=colors.black,
+            spaceBefore=15,
+            spaceAfter=5
+        )
+        
+        self.correct_style = ParagraphStyle(
+            'CorrectStyle',
+            parent=self.styles['BodyText'],
+            fontSize=11,
+            textColor=colors.green,
+            leftIndent=20
+        )
+        
+        self.incorrect_style = ParagraphStyle(
+            'IncorrectStyle',
+            parent=self.styles['BodyText'],
+            fontSize=11,
+            textColor=colors.red,
+            leftIndent=20
+        )
+        
+        self.option_style = ParagraphStyle(
+            'OptionStyle',
+            parent=self.styles['BodyText'],
+            fontSize=11,
+            leftIndent=20
+        )
+        
+        self.explanation_style = ParagraphStyle(
+            'ExplanationStyle',
+            parent=self.styles['BodyText'],
+            fontSize=10,
+            textColor=colors.blue,
+            leftIndent=20,
+            spaceBefore=5,
+            spaceAfter=10
+        )
+        
+        self.footer_style = ParagraphStyle(
+            'FooterStyle',
+            parent=self.styles['Normal'],
+            fontSize=8,
+            textColor=colors.gray,
+            alignment=1  # Center alignment
+        )
+        
+        self.feedback_style = ParagraphStyle(
+            'FeedbackStyle',
+            parent=self.styles['BodyText'],
+            fontSize=11,
+            leftIndent=10,
+            rightIndent=10,
+            spaceBefore=5,
+            spaceAfter=5
+        )
+        
+        self.score_table_style = TableStyle([
+            ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
+            ('TEXTCOLOR', (0, 0), (0, -1), colors.darkblue),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ('TOPPADDING', (0, 0), (-1, -1), 8),
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+        ])
+        
+        # Pie chart for correct vs incorrect. ReportLab widgets cannot be
+        # deep-copied, so keep the layout here and build a fresh chart per report.
+        self.score_chart_size = (400, 200)
+        self.score_pie_bounds = (150, 50, 100, 100)
+        self.score_slice_colors = (colors.lightgreen, colors.lightcoral)
+    
+    def score_chart(self, correct_count, incorrect_count):
+        """Return the score pie chart filled in for one report."""
+        drawing = Drawing(*self.score_chart_size)
+        pie = Pie()
+        pie.x, pie.y, pie.width, pie.height = self.score_pie_bounds
+        pie.data = [correct_count, incorrect_count]
+        pie.labels = [f'Correct ({correct_count})', f'Incorrect ({incorrect_count})']
+        pie.slices.strokeWidth = 0.5
+        for i, color in enumerate(self.score_slice_colors):
+            pie.slices[i].fillColor = color
+        drawing.add(pie, name="pie")
+        return drawing
+
+
+@st.cache_resource
+def get_report_templates():
+    """Process-wide report templates shared by every report."""
+    return ReportTemplates()
+
+
+@st.cache_resource
+def get_report_executor():
+    """Process-wide pool that builds detailed reports off the script thread."""
+    return ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+
+
 class AimockMCQGenerator:
     """A class to generate MCQs from PDF content using OpenAI API."""
     
@@ -321,64 +1734,153 @@ class AimockMCQGenerator:
         api_key = os.getenv("OPENAI_API_KEY") or st.session_state.get("openai_api_key", "")
        
         
-        self.client = OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key).client
+        self.scheduler = get_request_scheduler()
         self.model = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+        self.response_cache = get_llm_response_cache()
+        self.parse_stats = get_parse_stats()
+        self.token_budget = get_token_budget(self.model)
+        # Content hash of the most recently extracted PDF
+        self.last_pdf_hash = None
+        # Question-generation errors, for callers that run without a script context
+        self.errors = []
+        
+    def _chat_completion(self, messages, max_tokens, temperature, on_delta=None, json_mode=False, kind="chat", items=1):
+        """Return the text of a chat completion, served from the response cache when possible.
+
+        With on_delta, the completion is streamed and on_delta(text_so_far) is called
+        as tokens arrive; a cache hit calls it once with the full text. json_mode
+        requests a JSON object response when OPENAI_JSON_MODE is on and the model
+        has not rejected it before. Token usage is recorded in the TokenBudget under
+        kind, counting items outputs per completion.
+        """
+        extra = {}
+        if json_mode and OPENAI_JSON_MODE and self.model not in JSON_MODE_UNSUPPORTED_MODELS:
+            extra["response_format"] = {"type": "json_object"}
+        
+        key = None
+        if self.response_cache is not None:
+            key = LLMResponseCache.make_key(self.model, messages, temperature, max_tokens, **extra)
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                if on_delta:
+                    on_delta(cached)
+                return cached
         
-    def extract_text_from_pdf(self, pdf_file):
-        """Extract text from a PDF file."""
+        prompt_tokens = sum(self.token_budget.count_tokens(m["content"]) for m in messages)
+        estimated_tokens = prompt_tokens + max_tokens
+        
+        if on_delta:
+            parts = []
+            usage = None
+            finish_reason = None
+            # The stream keeps its scheduler slot until it is read or closed
+            with self.scheduler.call(lambda: self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+                stream_options={"include_usage": True}
+            ), estimated_tokens, stream=True) as stream:
+                for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        on_delta("".join(parts))
+                    if chunk.choices and getattr(chunk.choices[0], "finish_reason", None):
+                        finish_reason = chunk.choices[0].finish_reason
+            result = "".join(parts).strip()
+        else:
+            try:
+                response = self.scheduler.call(lambda: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    **extra
+                ), estimated_tokens)
+            except BadRequestError as e:
+                if "response_format" not in extra or "response_format" not in str(e):
+                    raise
+                # Older models reject JSON mode; remember that and ask again without it
+                logger.warning(f"Model {self.model} does not support JSON mode; falling back to plain output")
+                JSON_MODE_UNSUPPORTED_MODELS.add(self.model)
+                return self._chat_completion(messages, max_tokens, temperature, on_delta, kind=kind, items=items)
+            result = response.choices[0].message.content.strip()
+            usage = getattr(response, "usage", None)
+            finish_reason = getattr(response.choices[0], "finish_reason", None)
+        
+        self.token_budget.record(
+            kind,
+            usage.prompt_tokens if usage else prompt_tokens,
+            usage.completion_tokens if usage else self.token_budget.count_tokens(result),
+            items=items,
+            truncated=finish_reason == "length"
+        )
+        
+        if key is not None:
+            self.response_cache.put(key, result)
+        return result
+
+    def extract_text_from_pdf(self, pdf_file, progress_callback=None):
+        """Extract text from a PDF file, reusing earlier results for identical bytes.
+
+        progress_callback, if given, is called as progress_callback(pages_done, page_count).
+        """
         try:
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() or ""
+            pdf_bytes = pdf_file.getvalue() if hasattr(pdf_file, "getvalue") else pdf_file.read()
+            pdf_hash = hash_pdf_bytes(pdf_bytes)
+            self.last_pdf_hash = pdf_hash
             
-            # Basic text cleaning
-            text = text.replace('\n', ' ').replace('  ', ' ')
+            cache = get_pdf_text_cache()
+            text = cache.get(pdf_hash)
+            if text is not None:
+                logger.info(f"Using cached text for PDF {pdf_hash[:12]}")
+                return text
+            
+            page_texts = []
+            for page_number, page_count, page_text in iter_page_texts(pdf_bytes):
+                page_texts.append(page_text)
+                if progress_callback:
+                    progress_callback(page_number, page_count)
+            text = clean_text("".join(page_texts))
             
             if not text.strip():
                 logger.warning(f"No text extracted from PDF")
                 st.warning("No text could be extracted from the PDF. Please try a different file.")
                 return ""
+            
+            cache.put(pdf_hash, text)
             return text
         except Exception as e:
             logger.error(f"Error reading PDF: {e}")
             st.error(f"Error reading PDF: {e}")
             return ""
 
-    def generate_mcq(self, content, difficulty="Medium", topic=None):
-        """Generate MCQs using OpenAI API with context-aware options."""
+    def generate_mcq(self, content, difficulty="Medium", topic=None, passage_index=None, sampler=None):
+        """Generate MCQs using OpenAI API with context-aware options.
+
+        Pass the document's PassageIndex to avoid re-splitting content on every call,
+        and a PassageSampler to avoid repeating passages within a quiz.
+        """
         if not content.strip():
             logger.warning("Empty content provided for MCQ generation")
             return None
         
-        # Split content into manageable chunks
-        paragraphs = content.split(". ")
-        filtered_paragraphs = [p for p in paragraphs if len(p.split()) > 10]
+        if passage_index is None:
+            passage_index = PassageIndex(content)
         
-        if not filtered_paragraphs:
+        if not len(passage_index):
             logger.warning("No suitable paragraphs found for MCQ generation")
             return None
         
-        # Select the most informative paragraph
-        paragraph = random.choice(filtered_paragraphs) + "."
-        
-        # Difficulty-based prompting
-        difficulty_map = {
-            "Easy": {
-                "prompt": "Generate straightforward distractors with clear differences from the correct answer",
-                "temp": 0.5
-            },
-            "Medium": {
-                "prompt": "Generate moderately challenging distractors that are plausible but incorrect",
-                "temp": 0.7
-            },
-            "Hard": {
-                "prompt": "Generate sophisticated distractors that require careful analysis to distinguish from the correct answer",
-                "temp": 0.8
-            }
-        }
+        # Select the most informative paragraph, capped so bad extraction cannot blow up the prompt
+        paragraph = sampler.draw(1)[0] if sampler else passage_index.random_passage()
+        paragraph = self.token_budget.trim(paragraph, PASSAGE_TOKEN_LIMIT)
         
-        difficulty_settings = difficulty_map.get(difficulty, difficulty_map["Medium"])
+        difficulty_settings = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS["Medium"])
         topic_prompt = f" focused on the topic of {topic}" if topic else ""
         
         prompt = f"""
@@ -390,101 +1892,267 @@ class AimockMCQGenerator:
         
         Requirements:
         1. The question should be clear, concise, and academically rigorous
-        2. Create exactly 4 options labeled a, b, c, and d
+        2. Create exactly 4 options, in order a, b, c and d
         3. One option must be correct and clearly supported by the text
         4. Three options must be incorrect but plausible ({difficulty_settings['prompt']})
         5. All options should be similar in length and structure
         6. Ensure the correct answer isn't always in the same position
         
-        Format the response EXACTLY as:
-        Question: [Your question]
-        a. [Option 1]
-        b. [Option 2]
-        c. [Option 3]
-        d. [Option 4]
-        Correct: [just the letter of the correct option, e.g., "a"]
-        Explanation: [Brief explanation of why the correct answer is right]
+        Respond with ONLY a JSON object in this form:
+        {{"question": "...", "options": ["...", "...", "...", "..."], "correct": "a", "explanation": "..."}}
+        where "options" are in order a, b, c, d without letter prefixes, "correct" is just the letter
+        of the correct option and "explanation" briefly explains why the correct answer is right.
         """
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,  
+            result = self._chat_completion(
                 messages=[{"role": "user", "content": prompt}],
-                max_tokens=350,
-                temperature=difficulty_settings['temp']
+                max_tokens=self.token_budget.max_tokens_for("mcq", 350),
+                temperature=difficulty_settings['temp'],
+                json_mode=True,
+                kind="mcq"
             )
-            result = response.choices[0].message.content.strip()
-            
-            # Parse the response
-            lines = result.split("\n")
-            
-            # Extract question
-            question = ""
-            for line in lines:
-                if line.startswith("Question:"):
-                    question = line.replace("Question:", "").strip()
-                    break
-            
-            if not question:
-                logger.warning("Failed to extract question from API response")
-                return None
-            
-            # Extract options
-            options = []
-            for letter in ['a', 'b', 'c', 'd']:
-                option_prefix = f"{letter}."
-                for line in lines:
-                    if line.lower().startswith(option_prefix):
-                        option_text = line[len(option_prefix):].strip()
-                        options.append(option_text)
-                        break
-            
-            if len(options) != 4:
-                logger.warning(f"Expected 4 options but got {len(options)}")
+        except Exception as e:
+            logger.error(f"Error with OpenAI API: {e}")
+            self.errors.append(str(e))
+            # Background generation threads have no script context to show errors in
+            if get_script_run_ctx() is not None:
+                st.error(f"Error generating question: {e}")
+            return None
+        
+        # Parse the response: JSON first, then the tolerant line-based format
+        fields, mode = parse_mcq_response(result)
+        try:
+            mcq = build_mcq(
+                fields.get("question"), fields.get("options"), fields.get("correct", fields.get("correct_answer", "")),
+                fields.get("explanation"), paragraph, difficulty
+            )
+        except ValueError as e:
+            self.parse_stats.record(f"failed: {e}")
+            logger.warning(f"Failed to parse question from API response ({e}); parse stats: {self.parse_stats.snapshot()}")
+            return None
+        
+        self.parse_stats.record(mode)
+        return mcq
+
+    def generate_mcq_batch(self, content, count, difficulty="Medium", topic=None, passage_index=None, sampler=None):
+        """Generate several MCQs from different passages in a single API call.
+
+        Returns a list of question dicts (possibly shorter than count), or None
+        when the request or the JSON response fails entirely.
+        """
+        if not content.strip():
+            logger.warning("Empty content provided for MCQ generation")
+            return None
+        
+        if passage_index is None:
+            passage_index = PassageIndex(content)
+        
+        if not len(passage_index):
+            logger.warning("No suitable paragraphs found for MCQ generation")
+            return None
+        
+        # Draw distinct passages so one call does not ask twice about the same text
+        paragraphs = sampler.draw(count) if sampler else passage_index.sample(count)
+        paragraphs = [self.token_budget.trim(p, PASSAGE_TOKEN_LIMIT) for p in paragraphs]
+        
+        difficulty_settings = DIFFICULTY_SETTINGS.get(difficulty, DIFFICULTY_SETTINGS["Medium"])
+        topic_prompt = f" focused on the topic of {topic}" if topic else ""
+        passages = "\n".join(f'{i}. "{p}"' for i, p in enumerate(paragraphs, 1))
+        
+        prompt = f"""
+        Below are {count} numbered paragraphs from an educational text{topic_prompt}:
+        
+        {passages}
+        
+        For EACH paragraph, create one challenging multiple-choice question that tests understanding of a key concept or fact from that paragraph.
+        
+        Requirements:
+        1. Each question should be clear, concise, and academically rigorous
+        2. Create exactly 4 options per question, without letter prefixes
+        3. One option must be correct and clearly supported by the text
+        4. Three options must be incorrect but plausible ({difficulty_settings['prompt']})
+        5. All options should be similar in length and structure
+        6. Ensure the correct answer isn't always in the same position
+        
+        Respond with ONLY a JSON object holding {count} questions, one per paragraph, in this form:
+        {{"questions": [{{"passage": 1, "question": "...", "options": ["...", "...", "...", "..."], "correct": "a", "explanation": "..."}}]}}
+        """
+        
+        try:
+            result = self._chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=self.token_budget.max_tokens_for("mcq_batch", 310, items=count),
+                temperature=difficulty_settings['temp'],
+                json_mode=True,
+                kind="mcq_batch",
+                items=count
+            )
+        except Exception as e:
+            logger.error(f"Error with OpenAI API: {e}")
+            self.errors.append(str(e))
+            if get_script_run_ctx() is not None:
+                st.error(f"Error generating questions: {e}")
+            return None
+        
+        items = load_json_payload(result)
+        if isinstance(items, dict):
+            items = items.get("questions", [])
+        if not isinstance(items, list):
+            self.parse_stats.record("failed: batch response is not JSON")
+            logger.warning(f"Failed to parse batch response as JSON; parse stats: {self.parse_stats.snapshot()}")
+            return None
+        
+        mcqs = []
+        for item in items[:count]:
+            mcq = self._mcq_from_batch_item(item, paragraphs, difficulty)
+            self.parse_stats.record("json" if mcq else "failed: invalid batch question")
+            if mcq:
+                mcqs.append(mcq)
+        
+        if len(mcqs) < count:
+            logger.warning(f"Batch request returned {len(mcqs)} valid questions out of {count}")
+        return mcqs
+
+    @staticmethod
+    def _mcq_from_batch_item(item, paragraphs, difficulty):
+        """Validate one batch item and convert it to a question dict, or return None."""
+        if not isinstance(item, dict):
+            return None
+        
+        for field in BATCH_QUESTION_FIELDS:
+            if field not in item:
+                logger.warning(f"Batch question is missing '{field}'")
                 return None
+        
+        try:
+            passage = int(item["passage"])
+            # Passages are numbered from 1; never let 0 or negatives index from the end
+            if passage < 1:
+                raise IndexError(passage)
+            paragraph = paragraphs[passage - 1]
+        except (TypeError, ValueError, IndexError):
+            logger.warning(f"Batch question references unknown passage: {item['passage']}")
+            return None
+        
+        try:
+            return build_mcq(item["question"], item["options"], item["correct"], item["explanation"], paragraph, difficulty)
+        except ValueError as e:
+            logger.warning(f"Invalid batch question: {e}")
+            return None
+
+    def generate_mcqs(self, content, num_questions, difficulty="Medium", topic=None, max_workers=None, batch_size=None,
+                      passage_index=None, topic_index=None, duplicate_filter=None, question_bank=None, doc_hash=None,
+                      exclude=()):
+        """Generate MCQs concurrently, yielding each result as soon as it arrives.
+
+        Questions are requested batch_size at a time (QUESTIONS_PER_REQUEST by
+        default). Each slot is retried once, like the sequential flow, and failed
+        slots yield None so callers can keep their progress accurate. With a topic
+        and a BM25Index, passages are drawn from the best matches for the topic.
+        Near-duplicates of already accepted questions are rejected and replaced up
+        to MAX_DUPLICATE_REPLACEMENTS times per batch. Given a QuestionBank and the
+        document hash, stored questions are served first and new ones are saved;
+        questions whose text is in exclude are never served from the bank.
+        With QUIZ_RANDOM_SEED set, every run on a document sends the same prompts.
+        """
+        if duplicate_filter is None:
+            duplicate_filter = DuplicateQuestionFilter(DUPLICATE_SIMILARITY_THRESHOLD, seed=QUIZ_RANDOM_SEED)
+        
+        if question_bank is not None and doc_hash:
+            banked = [mcq for mcq in question_bank.fetch(doc_hash, difficulty, topic, num_questions, exclude)
+                      if duplicate_filter.add(mcq)]
+            if banked:
+                logger.info(f"Serving {len(banked)} of {num_questions} questions from the question bank")
+            yield from banked
+            num_questions -= len(banked)
+            if num_questions <= 0:
+                return
+        
+        batch_size = max(1, batch_size or QUESTIONS_PER_REQUEST)
+        if passage_index is None:
+            passage_index = PassageIndex(content)
+        
+        candidates = None
+        if topic and topic_index is not None:
+            matches = topic_index.search(topic, k=num_questions * TOPIC_CANDIDATES_PER_QUESTION)
+            if matches:
+                candidates = [i for i, _ in matches]
+                logger.info(f"Topic '{topic}' matched {len(candidates)} candidate passages")
+            else:
+                logger.info(f"Topic '{topic}' matched no passages; sampling the whole document")
+        
+        batches = [min(batch_size, num_questions - start) for start in range(0, num_questions, batch_size)]
+        if QUIZ_RANDOM_SEED is None:
+            # One section per question so the quiz covers the whole document
+            samplers = [PassageSampler(passage_index, num_sections=num_questions, candidates=candidates)] * len(batches)
+        else:
+            # Give each batch its own seeded sampler over an interleaved share of the
+            # passages, so what a batch asks about does not depend on thread timing
+            pool = list(range(len(passage_index))) if candidates is None else candidates
+            samplers = [
+                PassageSampler(passage_index, num_sections=count, candidates=pool[i::len(batches)] or pool,
+                               seed=f"{QUIZ_RANDOM_SEED}:{i}")
+                for i, count in enumerate(batches)
+            ]
+        max_workers = max(1, min(max_workers or MAX_CONCURRENT_REQUESTS, len(batches)))
+        
+        # Attach the Streamlit script context so st.error calls from workers still render
+        ctx = get_script_run_ctx()
+        
+        def init_worker():
+            if ctx is not None:
+                add_script_run_ctx(threading.current_thread(), ctx)
+        
+        def request(count, sampler):
+            if count == 1:
+                mcq = self.generate_mcq(content, difficulty, topic, passage_index, sampler)
+                return [mcq] if mcq else []
+            return self.generate_mcq_batch(content, count, difficulty, topic, passage_index, sampler) or []
+        
+        def generate_slots(count, sampler):
+            accepted = []
+            retries = 1
+            replacements = MAX_DUPLICATE_REPLACEMENTS
             
-            # Extract correct answer
-            correct_answer = ""
-            for line in lines:
-                if line.startswith("Correct:"):
-                    correct_answer = line.replace("Correct:", "").strip().lower()
-                    break
-                    
-            if not correct_answer or correct_answer not in 'abcd':
-                logger.warning(f"Invalid correct answer: {correct_answer}")
-                return None
+            while len(accepted) < count:
+                missing = count - len(accepted)
+                mcqs = request(missing, sampler)[:missing]
+                fresh = [mcq for mcq in mcqs if duplicate_filter.add(mcq)]
+                accepted += fresh
+                if question_bank is not None and doc_hash and fresh:
+                    question_bank.add(doc_hash, topic, fresh)
                 
-            # Extract explanation
-            explanation = ""
-            for i, line in enumerate(lines):
-                if line.startswith("Explanation:"):
-                    explanation = line.replace("Explanation:", "").strip()
-                    # If explanation continues on next lines
-                    j = i + 1
-                    while j < len(lines) and not lines[j].startswith(('Question:', 'a.', 'b.', 'c.', 'd.', 'Correct:')):
-                        explanation += " " + lines[j].strip()
-                        j += 1
+                if len(accepted) >= count:
+                    break
+                if len(mcqs) < missing and retries:
+                    # Try once more for the failed questions
+                    retries -= 1
+                elif len(fresh) < len(mcqs) and replacements:
+                    # Replace rejected duplicates with new questions
+                    replacements -= 1
+                else:
                     break
             
-            correct_option = options[ord(correct_answer) - ord('a')]
-            
-            return {
-                "question": question,
-                "options": options,
-                "correct_answer": correct_answer,
-                "correct_option": correct_option,
-                "explanation": explanation,
-                "difficulty": difficulty,
-                "paragraph": paragraph,
-            }
-                
-        except Exception as e:
-            logger.error(f"Error with OpenAI API: {e}")
-            st.error(f"Error generating question: {e}")
-            return None
+            return accepted + [None] * (count - len(accepted))
+        
+        with ThreadPoolExecutor(max_workers=max_workers, initializer=init_worker) as executor:
+            futures = [executor.submit(generate_slots, count, sampler) for count, sampler in zip(batches, samplers)]
+            try:
+                for future in as_completed(futures):
+                    yield from future.result()
+            finally:
+                # If the caller stops early, drop batches that have not started yet
+                for future in futures:
+                    future.cancel()
+
+    def generate_ai_feedback(self, questions, user_answers, final_score, on_update=None):
+        """Generate personalized AI feedback based on test performance.
 
-    def generate_ai_feedback(self, questions, user_answers, final_score):
-        """Generate personalized AI feedback based on test performance."""
+        With on_update, both completions are streamed and on_update(field, text_so_far)
+        is called from the calling thread as tokens arrive, where field is
+        "patterns" or "general_feedback". The final texts are returned either way.
+        """
         try:
             # Create summary of performance
             correct_count = sum(1 for i, ans in enumerate(user_answers) 
@@ -502,33 +2170,22 @@ class AimockMCQGenerator:
                         'explanation': questions[i].get('explanation', '')
                     })
             
-            if not wrong_questions:
-                patterns = "You answered all questions correctly!"
-            else:
-                # Create prompt for AI to analyze wrong answers
-                prompt_wrong = f"""
-                Based on the following incorrect answers from a multiple-choice test:
-                
-                {wrong_questions}
-                
-                Please provide:
-                1. A brief analysis of any patterns in the mistakes
-                2. 3-4 specific recommendations for improvement
-                3. A supportive and encouraging message
-                
-                Format as:
-                Analysis:
-                Recommendations:
-                Message:
-                """
-                
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[{"role": "user", "content": prompt_wrong}],
-                    max_tokens=350,
-                    temperature=0.7
-                )
-                patterns = response.choices[0].message.content.strip()
+            # Create prompt for AI to analyze wrong answers
+            prompt_wrong = f"""
+            Based on the following incorrect answers from a multiple-choice test:
+            
+            {self.token_budget.trim(str(wrong_questions), FEEDBACK_PROMPT_TOKEN_LIMIT)}
+            
+            Please provide:
+            1. A brief analysis of any patterns in the mistakes
+            2. 3-4 specific recommendations for improvement
+            3. A supportive and encouraging message
+            
+            Format as:
+            Analysis:
+            Recommendations:
+            Message:
+            """
             
             # Generate overall feedback based on score
             prompt_feedback = f"""
@@ -543,160 +2200,100 @@ class AimockMCQGenerator:
             Keep the tone supportive and actionable. Focus on learning and growth.
             """
             
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt_feedback}],
-                max_tokens=300,
-                temperature=0.7
-            )
-            
-            general_feedback = response.choices[0].message.content.strip()
-            
-            return {
-                "patterns": patterns,
-                "general_feedback": general_feedback
-            }
-            
         except Exception as e:
             logger.error(f"Error generating AI feedback: {e}")
-            return {
-                "patterns": "Unable to generate pattern analysis.",
-                "general_feedback": "Thank you for taking the test. Keep practicing to improve your knowledge."
-            }
+            return dict(FEEDBACK_FALLBACK)
+        
+        # Workers queue partial texts; the calling thread hands them to on_update
+        updates = queue.Queue() if on_update else None
+        
+        def complete(field, prompt, max_tokens):
+            # Each request fails independently so one error keeps the other's result
+            try:
+                return self._chat_completion(
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=self.token_budget.max_tokens_for(field, max_tokens),
+                    temperature=0.7,
+                    on_delta=(lambda text: updates.put((field, text))) if updates else None,
+                    kind=field
+                )
+            except Exception as e:
+                logger.error(f"Error generating AI feedback ({field}): {e}")
+                return FEEDBACK_FALLBACK[field]
+        
+        # Both completions are independent, so run them at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            patterns_future = executor.submit(complete, "patterns", prompt_wrong, 350) if wrong_questions else None
+            general_future = executor.submit(complete, "general_feedback", prompt_feedback, 300)
+            
+            if updates:
+                futures = [f for f in (patterns_future, general_future) if f]
+                while True:
+                    try:
+                        latest = dict([updates.get(timeout=0.05)])
+                    except queue.Empty:
+                        if all(f.done() for f in futures):
+                            break
+                        continue
+                    # Render only the newest text per field when tokens arrive faster than we draw
+                    while not updates.empty():
+                        field, text = updates.get_nowait()
+                        latest[field] = text
+                    for field, text in latest.items():
+                        on_update(field, text)
+            
+            patterns = patterns_future.result() if patterns_future else "You answered all questions correctly!"
+            general_feedback = general_future.result()
+        
+        return {
+            "patterns": patterns,
+            "general_feedback": general_feedback
+        }
 
-    def create_detailed_report(self, pdf_name, questions, user_answers, final_score):
-        """Create a visually appealing PDF report with detailed analytics."""
-        # Generate output filename
+    @staticmethod
+    def report_file_name():
+        """Download name for a detailed report generated now."""
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_file = f"PDF Quiz Generator Application Using AI_{timestamp}.pdf"
-        
-        # Generate AI feedback
-        feedback = self.generate_ai_feedback(questions, user_answers, final_score)
+        return f"PDF Quiz Generator Application Using AI_{timestamp}.pdf"
+
+    def create_detailed_report(self, pdf_name, questions, user_answers, final_score, feedback=None):
+        """Create a visually appealing PDF report with detailed analytics.
+
+        The report is built in memory and returned as PDF bytes (None on failure),
+        so nothing is written to the working directory. Pass feedback already
+        produced by generate_ai_feedback to avoid new API calls.
+        """
+        # Generate AI feedback unless the caller already has it
+        if feedback is None:
+            feedback = self.generate_ai_feedback(questions, user_answers, final_score)
         
         try:
             # Create document
-            doc = SimpleDocTemplate(output_file, pagesize=letter)
-            styles = getSampleStyleSheet()
-            
-            # Create custom styles
-            title_style = ParagraphStyle(
-                'CustomTitle', 
-                parent=styles['Title'],
-                fontSize=24,
-                spaceAfter=20,
-                textColor=colors.darkblue
-            )
-            
-            subtitle_style = ParagraphStyle(
-                'SubTitle',
-                parent=styles['Heading1'],
-                fontSize=18,
-                textColor=colors.darkblue,
-                spaceAfter=12
-            )
-            
-            section_style = ParagraphStyle(
-                'SectionTitle',
-                parent=styles['Heading2'],
-                fontSize=14,
-                textColor=colors.darkblue,
-                spaceBefore=15,
-                spaceAfter=10
-            )
-            
-            question_style = ParagraphStyle(
-                'QuestionStyle',
-                parent=styles['Heading3'],
-                fontSize=12,
-                textColor=colors.black,
-                spaceBefore=15,
-                spaceAfter=5
-            )
-            
-            correct_style = ParagraphStyle(
-                'CorrectStyle',
-                parent=styles['BodyText'],
-                fontSize=11,
-                textColor=colors.green,
-                leftIndent=20
-            )
-            
-            incorrect_style = ParagraphStyle(
-                'IncorrectStyle',
-                parent=styles['BodyText'],
-                fontSize=11,
-                textColor=colors.red,
-                leftIndent=20
-            )
-            
-            option_style = ParagraphStyle(
-                'OptionStyle',
-                parent=styles['BodyText'],
-                fontSize=11,
-                leftIndent=20
-            )
-            
-            explanation_style = ParagraphStyle(
-                'ExplanationStyle',
-                parent=styles['BodyText'],
-                fontSize=10,
-                textColor=colors.blue,
-                leftIndent=20,
-                spaceBefore=5,
-                spaceAfter=10
-            )
-            
-            footer_style = ParagraphStyle(
-                'FooterStyle',
-                parent=styles['Normal'],
-                fontSize=8,
-                textColor=colors.gray,
-                alignment=1  # Center alignment
-            )
-            
-            feedback_style = ParagraphStyle(
-                'FeedbackStyle',
-                parent=styles['BodyText'],
-                fontSize=11,
-                leftIndent=10,
-                rightIndent=10,
-                spaceBefore=5,
-                spaceAfter=5
-            )
+            buffer = io.BytesIO()
+            doc = SimpleDocTemplate(buffer, pagesize=letter)
+            templates = get_report_templates()
             
             # Start building the document
             story = []
             
             # Title
-            story.append(Paragraph(f"PDF Quiz Generator Application Using AI Assessment Report", title_style))
-            story.append(Paragraph(f"Generated from: {pdf_name}", styles["Italic"]))
+            story.append(Paragraph(f"PDF Quiz Generator Application Using AI Assessment Report", templates.title_style))
+            story.append(Paragraph(f"Generated from: {pdf_name}", templates.styles["Italic"]))
             
             # Date
             current_date = datetime.datetime.now().strftime("%B %d, %Y")
-            story.append(Paragraph(f"Date: {current_date}", styles["Normal"]))
+            story.append(Paragraph(f"Date: {current_date}", templates.styles["Normal"]))
             story.append(Spacer(1, 20))
             
             # Performance summary
-            story.append(Paragraph("Performance Summary", subtitle_style))
+            story.append(Paragraph("Performance Summary", templates.subtitle_style))
             
             # Create a pie chart for correct vs incorrect
             correct_count = sum(1 for i, ans in enumerate(user_answers) 
                               if ans == questions[i]['correct_answer'])
             incorrect_count = len(user_answers) - correct_count
             
-            drawing = Drawing(400, 200)
-            pie = Pie()
-            pie.x = 150
-            pie.y = 50
-            pie.width = 100
-            pie.height = 100
-            pie.data = [correct_count, incorrect_count]
-            pie.labels = [f'Correct ({correct_count})', f'Incorrect ({incorrect_count})']
-            pie.slices.strokeWidth = 0.5
-            pie.slices[0].fillColor = colors.lightgreen
-            pie.slices[1].fillColor = colors.lightcoral
-            drawing.add(pie)
-            story.append(drawing)
+            story.append(templates.score_chart(correct_count, incorrect_count))
             
             # Score summary
             score_data = [
@@ -707,40 +2304,31 @@ class AimockMCQGenerator:
             ]
             
             score_table = Table(score_data, colWidths=[2*inch, 2*inch])
-            score_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, -1), colors.lightblue),
-                ('TEXTCOLOR', (0, 0), (0, -1), colors.darkblue),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-                ('TOPPADDING', (0, 0), (-1, -1), 8),
-                ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
-            ]))
+            score_table.setStyle(templates.score_table_style)
             story.append(score_table)
             story.append(Spacer(1, 20))
             
             # AI Feedback
-            story.append(Paragraph("AI Analysis & Recommendations", subtitle_style))
+            story.append(Paragraph("AI Analysis & Recommendations", templates.subtitle_style))
             
-            story.append(Paragraph(feedback['general_feedback'], feedback_style))
+            story.append(Paragraph(feedback['general_feedback'], templates.feedback_style))
             story.append(Spacer(1, 10))
             
             if 'patterns' in feedback and feedback['patterns'] and feedback['patterns'] != "You answered all questions correctly!":
-                story.append(Paragraph("Pattern Analysis:", section_style))
-                story.append(Paragraph(feedback['patterns'], feedback_style))
+                story.append(Paragraph("Pattern Analysis:", templates.section_style))
+                story.append(Paragraph(feedback['patterns'], templates.feedback_style))
             
             story.append(Spacer(1, 20))
             
             # Detailed Question Analysis
-            story.append(Paragraph("Detailed Question Analysis", subtitle_style))
+            story.append(Paragraph("Detailed Question Analysis", templates.subtitle_style))
             
             for i, q in enumerate(questions, 1):
                 user_answer = user_answers[i-1] if i-1 < len(user_answers) else None
                 is_correct = user_answer == q['correct_answer'] if user_answer else False
                 
                 # Question number and text
-                story.append(Paragraph(f"Question {i}: {q['question']}", question_style))
+                story.append(Paragraph(f"Question {i}: {q['question']}", templates.question_style))
                 
                 # Display each option
                 for j, opt in enumerate(q['options']):
@@ -753,46 +2341,164 @@ class AimockMCQGenerator:
                     # Format differently based on correctness
                     if is_correct_option and is_user_option:
                         # User selected correctly
-                        story.append(Paragraph(f"✓ {option_text}", correct_style))
+                        story.append(Paragraph(f"✓ {option_text}", templates.correct_style))
                     elif is_correct_option and not is_user_option:
                         # User missed the correct answer
-                        story.append(Paragraph(f"✓ {option_text} (Correct Answer)", correct_style))
+                        story.append(Paragraph(f"✓ {option_text} (Correct Answer)", templates.correct_style))
                     elif not is_correct_option and is_user_option:
                         # User selected incorrectly
-                        story.append(Paragraph(f"✗ {option_text} (Your Answer)", incorrect_style))
+                        story.append(Paragraph(f"✗ {option_text} (Your Answer)", templates.incorrect_style))
                     else:
                         # Regular option
-                        story.append(Paragraph(option_text, option_style))
+                        story.append(Paragraph(option_text, templates.option_style))
                 
                 # Explanation
                 if 'explanation' in q and q['explanation']:
-                    story.append(Paragraph(f"Explanation: {q['explanation']}", explanation_style))
+                    story.append(Paragraph(f"Explanation: {q['explanation']}", templates.explanation_style))
                 
                 story.append(Spacer(1, 10))
             
             # Footer
             story.append(Spacer(1, 30))
-            story.append(Paragraph("Generated by PDF Quiz Generator Application Using AI| © 2025", footer_style))
+            story.append(Paragraph("Generated by PDF Quiz Generator Application Using AI| © 2025", templates.footer_style))
             
             # Build document
             doc.build(story)
-            logger.info(f"Detailed report exported to {output_file}")
-            return output_file
+            pdf_data = buffer.getvalue()
+            logger.info(f"Detailed report built in memory ({len(pdf_data)} bytes)")
+            return pdf_data
             
         except Exception as e:
             logger.error(f"Error creating detailed report: {e}")
-            st.error(f"Error creating report: {e}")
+            # Background report workers have no script context to show errors in
+            if get_script_run_ctx() is not None:
+                st.error(f"Error creating report: {e}")
             return None
 
 
+class QuizGenerationJob:
+    """Generates a quiz in a background thread so the test can start early.
+
+    Questions are appended to self.questions as they arrive; the test page reads
+    that list directly and only waits when the user gets ahead of generation.
+    Never touches Streamlit from the background thread: generation errors are
+    collected in self.errors for the test page to show.
+    """
+    
+    def __init__(self, generator, content, num_questions, difficulty="Medium", topic=None, **generate_kwargs):
+        self.target = num_questions
+        self.questions = []
+        self.failed = 0
+        # Shared with the generator, which appends API errors from its worker threads
+        self.errors = generator.errors
+        self.done = False
+        self.cancelled = False
+        self._ready = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(generator, content, difficulty, topic, generate_kwargs),
+            daemon=True
+        )
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def _run(self, generator, content, difficulty, topic, generate_kwargs):
+        try:
+            for mcq in generator.generate_mcqs(content, self.target, difficulty, topic, **generate_kwargs):
+                with self._ready:
+                    if mcq:
+                        self.questions.append(mcq)
+                    else:
+                        self.failed += 1
+                    self._ready.notify_all()
+                if self.cancelled:
+                    break
+        except Exception as e:
+            logger.error(f"Background quiz generation failed: {e}")
+            self.errors.append(str(e))
+        finally:
+            with self._ready:
+                self.done = True
+                self._ready.notify_all()
+    
+    @property
+    def expected_total(self):
+        """Number of questions the quiz will end up with, as far as is known now."""
+        return len(self.questions) if self.done else self.target - self.failed
+    
+    def wait_for(self, count, timeout=None):
+        """Block until at least count questions exist or generation ends; return whether they exist."""
+        with self._ready:
+            self._ready.wait_for(lambda: len(self.questions) >= count or self.done, timeout)
+            return len(self.questions) >= count
+    
+    def cancel(self):
+        self.cancelled = True
+
+
+class ReportJob:
+    """Handle for a detailed report being built on the shared report executor.
+
+    The results page keeps one of these in session state and polls status
+    instead of blocking its script run; the worker never touches Streamlit.
+    """
+    
+    def __init__(self, attempt_key, future, file_name):
+        self.attempt_key = attempt_key
+        self.file_name = file_name
+        self.submitted_at = time.time()
+        self._future = future
+    
+    @classmethod
+    def submit(cls, attempt_key, pdf_name, questions, user_answers, final_score, feedback):
+        """Queue a report for this attempt and return its handle immediately."""
+        generator = AimockMCQGenerator()
+        get_report_templates()  # build shared templates here rather than on a worker
+        future = get_report_executor().submit(
+            generator.create_detailed_report,
+            pdf_name, list(questions), list(user_answers), final_score, feedback
+        )
+        return cls(attempt_key, future, generator.report_file_name())
+    
+    @property
+    def status(self):
+        """'running' until the build finishes, then 'done' or 'failed'."""
+        if not self._future.done():
+            return "running"
+        if self._future.cancelled() or self._future.exception() is not None or not self._future.result():
+            return "failed"
+        return "done"
+    
+    @property
+    def elapsed(self):
+        return time.time() - self.submitted_at
+    
+    @property
+    def pdf_data(self):
+        return self._future.result() if self.status == "done" else None
+    
+    def cancel(self):
+        self._future.cancel()
+
+
 # Initialize session state variables
 def init_session_state():
     if 'page' not in st.session_state:
         st.session_state.page = 'home'
     if 'pdf_content' not in st.session_state:
         st.session_state.pdf_content = None
+    if 'passage_index' not in st.session_state:
+        st.session_state.passage_index = None
+    if 'topic_index' not in st.session_state:
+        st.session_state.topic_index = None
     if 'pdf_name' not in st.session_state:
         st.session_state.pdf_name = None
+    if 'pdf_hash' not in st.session_state:
+        st.session_state.pdf_hash = None
+    if 'served_questions' not in st.session_state:
+        st.session_state.served_questions = set()
     if 'questions' not in st.session_state:
         st.session_state.questions = []
     if 'current_question' not in st.session_state:
@@ -803,22 +2509,60 @@ def init_session_state():
         st.session_state.openai_api_key = os.getenv("OPENAI_API_KEY", "")
     if 'theme_color' not in st.session_state:
         st.session_state.theme_color = 'blue'
+    if 'feedback_cache' not in st.session_state:
+        st.session_state.feedback_cache = {}
+    if 'generation_job' not in st.session_state:
+        st.session_state.generation_job = None
+    if 'report_job' not in st.session_state:
+        st.session_state.report_job = None
+
+
+def cancel_generation_job():
+    """Stop any background generation left over from a previous quiz."""
+    if st.session_state.generation_job is not None:
+        st.session_state.generation_job.cancel()
+        st.session_state.generation_job = None
+
+
+def cancel_report_job():
+    """Drop the report for a previous attempt, unqueueing it if it has not started."""
+    if st.session_state.report_job is not None:
+        st.session_state.report_job.cancel()
+        st.session_state.report_job = None
+
+
+def quiz_total_questions():
+    """Number of questions in the current quiz, including ones still being generated."""
+    job = st.session_state.generation_job
+    if job is not None and job.questions is st.session_state.questions:
+        return job.expected_total
+    return len(st.session_state.questions)
 
 
 def go_to_home():
+    cancel_generation_job()
+    cancel_report_job()
     st.session_state.page = 'home'
     st.session_state.pdf_content = None
+    st.session_state.passage_index = None
+    st.session_state.topic_index = None
     st.session_state.pdf_name = None
+    st.session_state.pdf_hash = None
+    st.session_state.served_questions = set()
     st.session_state.questions = []
     st.session_state.current_question = 0
     st.session_state.user_answers = []
 
 
 def go_to_setup():
+    cancel_generation_job()
+    # Keep the next quiz on this PDF from repeating questions already asked
+    st.session_state.served_questions.update(mcq["question"] for mcq in st.session_state.questions)
     st.session_state.page = 'setup'
 
 
 def go_to_test():
+    cancel_report_job()
     st.session_state.page = 'test'
     st.session_state.current_question = 0
     st.session_state.user_answers = []
@@ -837,7 +2581,7 @@ def submit_answer(answer):
     st.session_state.user_answers.append(answer)
     
     # Move to next question or results page
-    if st.session_state.current_question < len(st.session_state.questions) - 1:
+    if st.session_state.current_question < quiz_total_questions() - 1:
         st.session_state.current_question += 1
         # Force a rerun to update the UI immediately
         st.rerun()
@@ -945,6 +2689,16 @@ def render_sidebar():
             For more information, contact support@yourpdfyourquiz.com
             """)
         
+        with st.expander("📈 Diagnostics"):
+            api_key = os.getenv("OPENAI_API_KEY") or st.session_state.get("openai_api_key", "")
+            response_cache = get_llm_response_cache()
+            st.json({
+                "connection_pool": get_openai_client(api_key).stats(),
+                "scheduler": get_request_scheduler().stats(),
+                "response_parsing": get_parse_stats().snapshot(),
+                "llm_cache": response_cache.stats() if response_cache else "disabled"
+            })
+        
         st.markdown('<hr style="margin: 20px 0;">', unsafe_allow_html=True)
         st.markdown('<p style="font-size: 12px; color: #6B7280; text-align: center;">© 2025 PDF Quiz Generator Application Using AI</p>', unsafe_allow_html=True)
 
@@ -1026,12 +2780,23 @@ def render_home_page():
             </div>
             """, unsafe_allow_html=True)
             
+            extraction_progress = st.progress(0.0, text="Reading pages...")
+            
+            def show_extraction_progress(pages_done, page_count):
+                extraction_progress.progress(pages_done / page_count, text=f"Reading page {pages_done} of {page_count}")
+            
             generator = AimockMCQGenerator()
-            pdf_content = generator.extract_text_from_pdf(uploaded_file)
+            pdf_content = generator.extract_text_from_pdf(uploaded_file, show_extraction_progress)
+            extraction_progress.empty()
             
             if pdf_content:
+                # Build the passage and topic indexes once per document, not once per question
+                if pdf_content != st.session_state.pdf_content or st.session_state.passage_index is None:
+                    st.session_state.passage_index = PassageIndex(pdf_content)
+                    st.session_state.topic_index = BM25Index(st.session_state.passage_index)
                 st.session_state.pdf_content = pdf_content
                 st.session_state.pdf_name = uploaded_file.name
+                st.session_state.pdf_hash = generator.last_pdf_hash
                 
                 st.markdown(f"""
                 <div class="success-box">
@@ -1159,6 +2924,13 @@ def render_setup_page():
             index=1,
             key="difficulty_radio"
         )
+        
+        progressive = st.checkbox(
+            "Start the quiz as soon as the first question is ready",
+            value=True,
+            key="progressive_checkbox",
+            help="Remaining questions keep generating in the background while you answer."
+        )
     
     # Generate test button with animation
     st.markdown("<div style='margin-top: 30px;'></div>", unsafe_allow_html=True)
@@ -1177,6 +2949,33 @@ def render_setup_page():
         #     </div>
         #     """, unsafe_allow_html=True)
         #     return
+        
+        cancel_generation_job()
+        
+        if progressive:
+            with st.spinner("Preparing your first question..."):
+                job = QuizGenerationJob(
+                    AimockMCQGenerator(), st.session_state.pdf_content, num_questions, difficulty, topic if topic else None,
+                    passage_index=st.session_state.passage_index, topic_index=st.session_state.topic_index,
+                    question_bank=get_question_bank(), doc_hash=st.session_state.pdf_hash,
+                    exclude=frozenset(st.session_state.served_questions)
+                ).start()
+                job.wait_for(1)
+            
+            if job.questions:
+                # Open the test right away; the rest of the quiz fills in behind it
+                st.session_state.generation_job = job
+                st.session_state.questions = job.questions
+                go_to_test()
+                st.rerun()
+            
+            st.markdown("""
+            <div class="warning-box">
+                <h3>Generation Failed</h3>
+                <p>Could not generate questions from the content. Please try different settings or upload a different PDF with more textual content.</p>
+            </div>
+            """, unsafe_allow_html=True)
+            return
             
         with st.spinner(f"Creating your personalized quiz with {num_questions} questions..."):
             generator = AimockMCQGenerator()
@@ -1187,24 +2986,31 @@ def render_setup_page():
             progress_bar = progress_container.progress(0)
             progress_text = progress_container.empty()
             
-            for i in range(num_questions):
+            completed = 0
+            progress_text.markdown(f"""
+            <div style='text-align: center;'>
+                <p>Generating {num_questions} questions in parallel</p>
+                <p style='font-size: 12px; color: #6B7280;'>Analyzing content and creating challenging questions...</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            for mcq in generator.generate_mcqs(
+                st.session_state.pdf_content, num_questions, difficulty, topic if topic else None,
+                passage_index=st.session_state.passage_index, topic_index=st.session_state.topic_index,
+                question_bank=get_question_bank(), doc_hash=st.session_state.pdf_hash,
+                exclude=frozenset(st.session_state.served_questions)
+            ):
+                if mcq:
+                    questions.append(mcq)
+                completed += 1
+                
+                progress_bar.progress(completed / num_questions)
                 progress_text.markdown(f"""
                 <div style='text-align: center;'>
-                    <p>Generating question {i+1}/{num_questions}</p>
+                    <p>Generated question {completed}/{num_questions}</p>
                     <p style='font-size: 12px; color: #6B7280;'>Analyzing content and creating challenging questions...</p>
                 </div>
                 """, unsafe_allow_html=True)
-                
-                mcq = generator.generate_mcq(st.session_state.pdf_content, difficulty, topic if topic else None)
-                if mcq:
-                    questions.append(mcq)
-                else:
-                    # Try once more
-                    mcq = generator.generate_mcq(st.session_state.pdf_content, difficulty, topic if topic else None)
-                    if mcq:
-                        questions.append(mcq)
-                
-                progress_bar.progress((i + 1) / num_questions)
             
             progress_text.empty()
             
@@ -1251,8 +3057,8 @@ def render_setup_page():
 def render_test_page():
     # Display app banner with progress
     q_idx = st.session_state.current_question
-    total_q = len(st.session_state.questions)
-    progress_percent = (q_idx) / total_q
+    total_q = quiz_total_questions()
+    progress_percent = (q_idx) / total_q if total_q > 0 else 1.0
     
     st.markdown(f"""
     <div class="app-banner">
@@ -1262,7 +3068,22 @@ def render_test_page():
     """, unsafe_allow_html=True)
     
     # Progress bar
-    st.progress(progress_percent)
+    st.progress(min(progress_percent, 1.0))
+    
+    # Wait only if the user has caught up with background generation
+    job = st.session_state.generation_job
+    if q_idx >= len(st.session_state.questions):
+        if job is not None and not job.done:
+            with st.spinner("Generating your next question..."):
+                job.wait_for(q_idx + 1, timeout=30)
+        else:
+            go_to_results()
+        st.rerun()
+    
+    if job is not None and not job.done:
+        st.caption(f"{len(st.session_state.questions)} of {total_q} questions ready; the rest are still being generated.")
+    if job is not None and job.errors:
+        st.error(f"Error generating questions ({len(job.errors)} failed requests): {job.errors[-1]}")
     
     if q_idx < total_q:
         question = st.session_state.questions[q_idx]
@@ -1318,6 +3139,56 @@ def render_test_page():
         """, unsafe_allow_html=True)
 
 
+def report_status_fragment(func):
+    """Rerun func by itself every REPORT_POLL_SECONDS where Streamlit has fragments."""
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if fragment is None:
+        return func
+    func = fragment(run_every=REPORT_POLL_SECONDS)(func)
+    func.polls = True
+    return func
+
+
+@report_status_fragment
+def poll_report_status(job):
+    """Show a running report's progress, rerunning the whole page once it finishes."""
+    if job.status != "running":
+        # A full rerun re-enables the generate button and renders the result once
+        st.rerun()
+    
+    st.info(f"⏳ Creating your personalized performance report ({job.elapsed:.0f}s)... "
+            "keep reviewing your answers in the meantime.")
+    if not getattr(poll_report_status, "polls", False):
+        st.button("🔄 Check report status", key="report_status_btn", use_container_width=True)
+
+
+def render_report_status(attempt_key):
+    """Show progress of this attempt's background report, then its download button."""
+    job = st.session_state.report_job
+    if job is None or job.attempt_key != attempt_key:
+        return
+    
+    status = job.status
+    if status == "running":
+        # Only a running report polls, so idle pages do not rerun every tick
+        poll_report_status(job)
+    elif status == "done":
+        # Success animation
+        st.success("Report generated successfully!")
+        
+        # Provide download button
+        st.download_button(
+            label="📥 Download Your Report",
+            data=job.pdf_data,
+            file_name=job.file_name,
+            mime="application/pdf",
+            key="download_report_btn",
+            use_container_width=True
+        )
+    else:
+        st.error("Failed to generate report. Please try again.")
+
+
 def render_results_page():
     # Calculate score
     questions = st.session_state.questions
@@ -1386,42 +3257,56 @@ def render_results_page():
         </div>
         """, unsafe_allow_html=True)
     
-    # Generate and display AI feedback
-    with st.spinner("Generating personalized feedback..."):
-        generator = AimockMCQGenerator()
-        feedback = generator.generate_ai_feedback(questions, user_answers, final_score)
-        
-        st.markdown("""
-        <div style="margin-top: 40px;">
-            <h2 style="color: #3B82F6;">AI-Powered Feedback</h2>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        st.markdown(f"""
-        <div class="feedback-card" style="background: linear-gradient(135deg, #F0F9FF 0%, #E0F2FE 100%);">
-            <div style="display: flex; align-items: flex-start;">
-                <img src="https://img.icons8.com/color/48/000000/artificial-intelligence.png" style="margin-right: 15px;">
-                <div>
-                    <div class="feedback-title">Performance Analysis</div>
-                    <p>{feedback['general_feedback']}</p>
+    # Display AI feedback
+    st.markdown("""
+    <div style="margin-top: 40px;">
+        <h2 style="color: #3B82F6;">AI-Powered Feedback</h2>
+    </div>
+    """, unsafe_allow_html=True)
+    
+    general_card = st.empty()
+    patterns_card = st.empty()
+    
+    def render_feedback_card(field, text):
+        if field == "general_feedback":
+            general_card.markdown(f"""
+            <div class="feedback-card" style="background: linear-gradient(135deg, #F0F9FF 0%, #E0F2FE 100%);">
+                <div style="display: flex; align-items: flex-start;">
+                    <img src="https://img.icons8.com/color/48/000000/artificial-intelligence.png" style="margin-right: 15px;">
+                    <div>
+                        <div class="feedback-title">Performance Analysis</div>
+                        <p>{text}</p>
+                    </div>
                 </div>
             </div>
-        </div>
-        """, unsafe_allow_html=True)
-        
-        if 'patterns' in feedback and feedback['patterns'] and feedback['patterns'] != "You answered all questions correctly!":
-            st.markdown(f"""
+            """, unsafe_allow_html=True)
+        elif text and text != "You answered all questions correctly!":
+            patterns_card.markdown(f"""
             <div class="feedback-card" style="background: linear-gradient(135deg, #F0FDF4 0%, #DCFCE7 100%);">
                 <div style="display: flex; align-items: flex-start;">
                     <img src="https://img.icons8.com/color/48/000000/brain.png" style="margin-right: 15px;">
                     <div>
                         <div class="feedback-title">Learning Pattern Analysis</div>
-                        <p>{feedback['patterns']}</p>
+                        <p>{text}</p>
                     </div>
                 </div>
             </div>
             """, unsafe_allow_html=True)
     
+    # Generate AI feedback once per attempt; reruns and the PDF report reuse it
+    attempt_key = feedback_attempt_key(questions, user_answers, final_score)
+    feedback = st.session_state.feedback_cache.get(attempt_key)
+    if feedback is None:
+        with st.spinner("Generating personalized feedback..."):
+            # Stream tokens into the cards as they arrive
+            generator = AimockMCQGenerator()
+            feedback = generator.generate_ai_feedback(questions, user_answers, final_score, on_update=render_feedback_card)
+            st.session_state.feedback_cache = {attempt_key: feedback}
+    
+    render_feedback_card("general_feedback", feedback['general_feedback'])
+    if 'patterns' in feedback:
+        render_feedback_card("patterns", feedback['patterns'])
+    
     # Question Review
     st.markdown("""
     <div style="margin-top: 40px;">
@@ -1488,32 +3373,18 @@ def render_results_page():
         """, unsafe_allow_html=True)
     
     with report_col2:
-        if st.button("📊 Generate Detailed PDF Report", key="generate_report_btn", use_container_width=True):
-            with st.spinner("Creating your personalized performance report..."):
-                generator = AimockMCQGenerator()
-                report_path = generator.create_detailed_report(
-                    st.session_state.pdf_name, questions, user_answers, final_score
-                )
-                
-                if report_path:
-                    # Read the PDF file
-                    with open(report_path, "rb") as file:
-                        pdf_data = file.read()
-                    
-                    # Success animation
-                    st.success("Report generated successfully!")
-                    
-                    # Provide download button
-                    st.download_button(
-                        label="📥 Download Your Report",
-                        data=pdf_data,
-                        file_name=os.path.basename(report_path),
-                        mime="application/pdf",
-                        key="download_report_btn",
-                        use_container_width=True
-                    )
-                else:
-                    st.error("Failed to generate report. Please try again.")
+        # Reports build on a background worker; the status area below polls it
+        job = st.session_state.report_job
+        building = job is not None and job.attempt_key == attempt_key and job.status == "running"
+        if st.button("📊 Generate Detailed PDF Report", key="generate_report_btn", use_container_width=True, disabled=building):
+            cancel_report_job()
+            st.session_state.report_job = ReportJob.submit(
+                attempt_key, st.session_state.pdf_name, questions, user_answers, final_score, feedback
+            )
+            # Rerun so the button renders disabled while the report builds
+            st.rerun()
+        
+        render_report_status(attempt_key)
     
     # Next steps section
     st.markdown("""
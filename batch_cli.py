@@ -0,0 +1,207 @@
+"""Generate quizzes for a directory or manifest of PDFs without the Streamlit UI.
+
+    python batch_cli.py lectures/ -o quizzes.jsonl --num-questions 10
+    python batch_cli.py manifest.txt -o quizzes.jsonl --resume
+
+A manifest lists one PDF path per line (relative to the manifest), or one JSON
+object per line with "path" and optional "num_questions", "difficulty" and
+"topic" overrides. Text is extracted in a process pool, one document per worker,
+while earlier documents are already generating. Every document shares the app's
+request scheduler, so OPENAI_MAX_CONCURRENCY and the OPENAI_*_LIMIT settings
+apply to the run as a whole. Each document is appended to the output as one JSON
+line as soon as its quiz is complete.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from pdf_extraction import PROCESS_CONTEXT, extract_file
+from app import (
+    logger, AimockMCQGenerator, PassageIndex, BM25Index, DIFFICULTY_SETTINGS,
+    get_pdf_text_cache, get_question_bank, get_request_scheduler, hash_pdf_bytes
+)
+
+
+def load_documents(source, defaults):
+    """Return one settings dict per PDF in a directory (recursively) or manifest file."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            paths += [os.path.join(root, name) for name in files if name.lower().endswith(".pdf")]
+        return [dict(defaults, path=path) for path in sorted(paths)]
+
+    documents = []
+    base_dir = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            if "path" not in entry:
+                raise ValueError(f"{source}:{line_number}: manifest entry has no path")
+            if entry.get("difficulty", defaults["difficulty"]) not in DIFFICULTY_SETTINGS:
+                raise ValueError(f"{source}:{line_number}: unknown difficulty {entry['difficulty']!r}")
+            entry["path"] = os.path.join(base_dir, entry["path"])
+            documents.append(dict(defaults, **entry))
+    return documents
+
+
+def completed_paths(output_path):
+    """Paths already written to output_path with status "ok", for --resume."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record.get("path"))
+    return done
+
+
+def generate_quiz(document, pdf_hash, text, use_bank):
+    """Generate one document's quiz; runs on a generation thread."""
+    started = time.perf_counter()
+    generator = AimockMCQGenerator()
+    passage_index = PassageIndex(text)
+    topic_index = BM25Index(passage_index) if document["topic"] else None
+
+    questions = []
+    failed = 0
+    for mcq in generator.generate_mcqs(
+        text, document["num_questions"], document["difficulty"], document["topic"],
+        passage_index=passage_index, topic_index=topic_index,
+        question_bank=get_question_bank() if use_bank else None, doc_hash=pdf_hash
+    ):
+        if mcq:
+            questions.append(mcq)
+        else:
+            failed += 1
+
+    return {
+        "status": "ok" if questions else "failed",
+        "questions": questions,
+        "failed": failed,
+        "generate_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+def run(documents, output, extract_workers, documents_in_flight, use_bank):
+    """Extract, generate and write every document; return (written, questions)."""
+    cache = get_pdf_text_cache()
+    written = 0
+    total_questions = 0
+
+    def write(document, **fields):
+        nonlocal written, total_questions
+        record = {key: document[key] for key in ("path", "num_questions", "difficulty", "topic")}
+        record.update(fields)
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        written += 1
+        total_questions += len(fields.get("questions", []))
+        logger.info(f"[{written}/{len(documents)}] {document['path']}: {fields['status']}, "
+                    f"{len(fields.get('questions', []))} questions")
+
+    pending = {}
+    with ProcessPoolExecutor(max_workers=extract_workers, mp_context=PROCESS_CONTEXT) as extractors, \
+            ThreadPoolExecutor(max_workers=documents_in_flight, thread_name_prefix="quiz") as generators:
+
+        def start_generation(document, pdf_hash, text, extract_seconds):
+            if not text.strip():
+                write(document, status="empty", pdf_hash=pdf_hash, questions=[], extract_seconds=extract_seconds)
+                return
+            future = generators.submit(generate_quiz, document, pdf_hash, text, use_bank)
+            pending[future] = ("generate", document, pdf_hash, extract_seconds)
+
+        for document in documents:
+            try:
+                with open(document["path"], "rb") as f:
+                    pdf_hash = hash_pdf_bytes(f.read())
+            except OSError as e:
+                write(document, status="error", error=str(e))
+                continue
+
+            text = cache.get(pdf_hash)
+            if text is not None:
+                start_generation(document, pdf_hash, text, 0.0)
+            else:
+                pending[extractors.submit(extract_file, document["path"])] = ("extract", document, pdf_hash, None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, document, pdf_hash, extract_seconds = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to {stage} {document['path']}: {e}")
+                    write(document, status="error", pdf_hash=pdf_hash, error=f"{stage}: {e}")
+                    continue
+
+                if stage == "extract":
+                    pdf_hash, text, extract_seconds = result
+                    if text.strip():
+                        cache.put(pdf_hash, text)
+                    start_generation(document, pdf_hash, text, round(extract_seconds, 3))
+                else:
+                    write(document, pdf_hash=pdf_hash, extract_seconds=extract_seconds, **result)
+
+    return written, total_questions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate quizzes for many PDFs and write them as JSON lines.")
+    parser.add_argument("source", help="directory of PDFs (searched recursively) or manifest file")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append one quiz per document to")
+    parser.add_argument("-n", "--num-questions", type=int, default=10, help="questions per document (default 10)")
+    parser.add_argument("-d", "--difficulty", choices=list(DIFFICULTY_SETTINGS), default="Medium")
+    parser.add_argument("-t", "--topic", default=None, help="focus every quiz on this topic")
+    parser.add_argument("--extract-workers", type=int, default=os.cpu_count() or 1,
+                        help="processes extracting PDF text (default: CPU count)")
+    parser.add_argument("--documents-in-flight", type=int, default=4,
+                        help="documents generating at once; they share one request scheduler (default 4)")
+    parser.add_argument("--no-question-bank", action="store_true",
+                        help="always generate new questions instead of serving banked ones")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip documents already written to the output with status ok")
+    args = parser.parse_args(argv)
+
+    if not os.getenv("OPENAI_API_KEY"):
+        parser.error("OPENAI_API_KEY must be set")
+
+    defaults = {"num_questions": args.num_questions, "difficulty": args.difficulty, "topic": args.topic}
+    try:
+        documents = load_documents(args.source, defaults)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.resume:
+        done = completed_paths(args.output)
+        documents = [document for document in documents if document["path"] not in done]
+    if not documents:
+        logger.info("No documents to process")
+        return 0
+
+    started = time.perf_counter()
+    with open(args.output, "a" if args.resume else "w", encoding="utf-8") as output:
+        written, total_questions = run(
+            documents, output, max(1, args.extract_workers), max(1, args.documents_in_flight),
+            not args.no_question_bank
+        )
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Wrote {written} documents and {total_questions} questions to {args.output} in {elapsed:.1f}s; "
+                f"scheduler {get_request_scheduler().stats()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
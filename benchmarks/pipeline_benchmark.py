@@ -0,0 +1,213 @@
+"""End-to-end benchmark of the quiz pipeline against the local mock OpenAI server.
+
+Each run plays one user's session on a freshly generated PDF: extract its text,
+generate the quiz, answer it at random, stream AI feedback and build the
+detailed report. Runs execute --concurrency at a time against an in-process
+mock_openai_server, so no API key or network access is needed.
+
+    python benchmarks/pipeline_benchmark.py --runs 20 --concurrency 4 --questions 10
+    python benchmarks/pipeline_benchmark.py --latency lognormal:1.2,0.6 --rate-limit-rate 0.05 --malformed-rate 0.05
+
+Prints throughput, p50/p95/p99 latency for each stage and end to end, and API
+calls per delivered question (retries, duplicate replacements and feedback
+calls included). --json writes the same figures for comparing runs.
+
+With --cassette, a record run saves every API exchange and a replay run serves
+them back without the mock server. Replaying with --cassette-latency zero
+leaves only the CPU-side cost of parsing, streaming and report building:
+
+    python benchmarks/pipeline_benchmark.py --cassette run.jsonl --cassette-mode record
+    python benchmarks/pipeline_benchmark.py --cassette run.jsonl --cassette-mode replay --cassette-latency zero
+"""
+import io
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_openai_server import MockOpenAIServer, add_behaviour_arguments, behaviour_from_args
+
+STAGES = ["extract", "first_question", "generate", "feedback", "report", "total"]
+
+VOCABULARY = (
+    "cell membrane protein enzyme energy light carbon oxygen glucose nucleus gene inheritance variation "
+    "population ecosystem predator prey climate water cycle nitrogen soil root leaf photosynthesis "
+    "respiration mitochondria chloroplast diffusion osmosis transport signal hormone nerve muscle "
+    "evolution selection adaptation species fossil record experiment hypothesis evidence theory model"
+).split()
+
+
+def make_pdf(pages, rng):
+    """Return the bytes of a PDF of random sentences, unique per call so caches stay cold."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+    
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    for _ in range(pages):
+        y = 740
+        while y > 60:
+            words = [rng.choice(VOCABULARY) for _ in range(rng.randint(12, 20))]
+            pdf.drawString(50, y, " ".join(words).capitalize() + ".")
+            y -= 16
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def run_session(app, pdf_bytes, num_questions, difficulty, batch_size, rng):
+    """Run one session through the pipeline; return (stage timings in seconds, questions, report ok)."""
+    timings = {}
+    generator = app.AimockMCQGenerator()
+    started = time.perf_counter()
+    
+    text = generator.extract_text_from_pdf(io.BytesIO(pdf_bytes))
+    timings["extract"] = time.perf_counter() - started
+    
+    stage_start = time.perf_counter()
+    questions = []
+    for mcq in generator.generate_mcqs(text, num_questions, difficulty, batch_size=batch_size,
+                                       passage_index=app.PassageIndex(text)):
+        if mcq:
+            questions.append(mcq)
+            timings.setdefault("first_question", time.perf_counter() - stage_start)
+    timings["generate"] = time.perf_counter() - stage_start
+    
+    # Questions arrive in completion order; fix the order so feedback prompts repeat under replay
+    questions.sort(key=lambda q: q["question"])
+    user_answers = [rng.choice("abcd") for _ in questions]
+    correct = sum(1 for q, a in zip(questions, user_answers) if a == q["correct_answer"])
+    score = int(correct / len(questions) * 100) if questions else 0
+    
+    stage_start = time.perf_counter()
+    feedback = generator.generate_ai_feedback(questions, user_answers, score, on_update=lambda field, text: None)
+    timings["feedback"] = time.perf_counter() - stage_start
+    
+    stage_start = time.perf_counter()
+    report = generator.create_detailed_report("benchmark.pdf", questions, user_answers, score, feedback)
+    timings["report"] = time.perf_counter() - stage_start
+    
+    timings["total"] = time.perf_counter() - started
+    return timings, len(questions), bool(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20, help="sessions to run (default 20)")
+    parser.add_argument("--concurrency", type=int, default=4, help="sessions running at once (default 4)")
+    parser.add_argument("--questions", type=int, default=10, help="questions per quiz (default 10)")
+    parser.add_argument("--difficulty", default="Medium")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="questions per API call; 1 calls generate_mcq per question (default QUESTIONS_PER_REQUEST)")
+    parser.add_argument("--pages", type=int, default=5, help="pages per generated PDF (default 5)")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--cassette", help="record API exchanges to, or replay them from, this file")
+    parser.add_argument("--cassette-mode", choices=["record", "replay"], default="record")
+    parser.add_argument("--cassette-latency", choices=["original", "zero"], default="original",
+                        help="replay at the recorded pace or as fast as possible")
+    add_behaviour_arguments(parser)
+    parser.set_defaults(seed=0)
+    args = parser.parse_args()
+    
+    replaying = args.cassette and args.cassette_mode == "replay"
+    server = None if replaying else MockOpenAIServer(("127.0.0.1", 0), behaviour_from_args(args)).start()
+    
+    # Point the app at the mock before it reads its settings; never serve from caches
+    os.environ["OPENAI_BASE_URL"] = server.base_url if server else "http://127.0.0.1:9/v1"
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["LLM_CACHE_PATH"] = ""
+    os.environ["PDF_CACHE_DIR"] = ""
+    os.environ["QUIZ_RANDOM_SEED"] = str(args.seed)
+    if args.cassette:
+        os.environ["OPENAI_CASSETTE"] = args.cassette
+        os.environ["OPENAI_CASSETTE_MODE"] = args.cassette_mode
+        os.environ["OPENAI_CASSETTE_LATENCY"] = args.cassette_latency
+    import app
+    
+    # Build the shared client (and cassette) once before sessions race to create it
+    cassette = app.get_openai_client("mock").cassette
+    
+    rng = random.Random(args.seed)
+    pdfs = [make_pdf(args.pages, rng) for _ in range(args.runs)]
+    seeds = [rng.getrandbits(32) for _ in range(args.runs)]
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        results = list(executor.map(
+            lambda i: run_session(app, pdfs[i], args.questions, args.difficulty, args.batch_size, random.Random(seeds[i])),
+            range(args.runs)
+        ))
+    elapsed = time.perf_counter() - started
+    
+    delivered = sum(count for _, count, _ in results)
+    reports = sum(1 for _, _, ok in results if ok)
+    server_stats = server.stats() if server else {}
+    api_calls = cassette.stats()["replayed"] if replaying else server_stats.get("requests", 0)
+    
+    summary = {
+        "runs": args.runs,
+        "concurrency": args.concurrency,
+        "questions_requested": args.questions * args.runs,
+        "questions_delivered": delivered,
+        "reports_built": reports,
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_minute": round(args.runs / elapsed * 60, 2),
+        "questions_per_second": round(delivered / elapsed, 2),
+        "api_calls": api_calls,
+        "api_calls_per_question": round(api_calls / delivered, 3) if delivered else None,
+        "latency_ms": {},
+        "mock_server": server_stats,
+        "cassette": cassette.stats() if cassette else None,
+        "scheduler": app.get_request_scheduler().stats(),
+        "parse_stats": app.get_parse_stats().snapshot(),
+        "behaviour": {key: getattr(args, key) for key in
+                      ("latency", "tokens_per_second", "error_rate", "rate_limit_rate", "malformed_rate", "seed")},
+    }
+    
+    source = f"replaying {args.cassette} ({args.cassette_latency} latency)" if replaying else f"mock latency {args.latency}"
+    print(f"{args.runs} sessions x {args.questions} questions, {args.concurrency} at a time, {source}\n")
+    print(f"{'stage':>14}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'mean ms':>9}")
+    for stage in STAGES:
+        values = [timings[stage] * 1000 for timings, _, _ in results if stage in timings]
+        if not values:
+            continue
+        row = {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+               "mean": statistics.mean(values)}
+        summary["latency_ms"][stage] = {key: round(value, 1) for key, value in row.items()}
+        print(f"{stage:>14}  {row['p50']:>9.1f}  {row['p95']:>9.1f}  {row['p99']:>9.1f}  {row['mean']:>9.1f}")
+    
+    print(f"\nThroughput: {summary['sessions_per_minute']} sessions/min, {summary['questions_per_second']} questions/s "
+          f"({elapsed:.1f}s total)")
+    print(f"Delivered {delivered}/{summary['questions_requested']} questions and {reports}/{args.runs} reports")
+    print(f"API calls: {api_calls} ({summary['api_calls_per_question']} per delivered question)")
+    if server:
+        print(f"Mock server: {server_stats}")
+    if cassette:
+        print(f"Cassette: {summary['cassette']}")
+    print(f"Scheduler: {summary['scheduler']}")
+    print(f"Parse outcomes: {summary['parse_stats']}")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    app.get_openai_client("mock").http_client.close()
+    if server:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark detailed report construction for 5-, 20- and 200-question quizzes.
+
+Runs create_detailed_report with precomputed feedback, so no API calls are made.
+
+    python benchmarks/report_benchmark.py [--repeats 10]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import statistics
+
+# Keep the benchmark from creating a response cache in the working directory
+os.environ.setdefault("LLM_CACHE_PATH", "")
+# The OpenAI client needs a key to construct, though reports never call the API
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import AimockMCQGenerator, get_report_templates
+
+QUIZ_SIZES = [5, 20, 200]
+
+
+def make_quiz(num_questions, seed=0):
+    """Build a synthetic quiz and answer sheet of the given size."""
+    rng = random.Random(seed)
+    questions = []
+    for i in range(num_questions):
+        correct_answer = rng.choice("abcd")
+        options = [f"Option {letter} for question {i + 1}, a plausible answer of typical length" for letter in "abcd"]
+        questions.append({
+            "question": f"Question {i + 1}: which statement best describes the concept discussed in passage {i + 1}?",
+            "options": options,
+            "correct_answer": correct_answer,
+            "correct_option": options[ord(correct_answer) - ord('a')],
+            "explanation": "The passage states this directly, and the distractors contradict its main claim. " * 2,
+            "difficulty": "Medium",
+            "paragraph": "A representative passage from the source document. " * 4,
+        })
+    user_answers = [rng.choice("abcd") for _ in questions]
+    return questions, user_answers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=10, help="timed runs per quiz size")
+    args = parser.parse_args()
+    
+    generator = AimockMCQGenerator()
+    feedback = {
+        "patterns": "Analysis: mistakes cluster around definitions. Recommendations: review key terms.",
+        "general_feedback": "Good effort. Revisit the sections you missed and try the quiz again."
+    }
+    
+    start = time.perf_counter()
+    get_report_templates()
+    print(f"Template build (once per process): {(time.perf_counter() - start) * 1000:.1f} ms\n")
+    
+    print(f"{'questions':>9}  {'median ms':>10}  {'min ms':>8}  {'max ms':>8}  {'size KB':>8}")
+    for size in QUIZ_SIZES:
+        questions, user_answers = make_quiz(size)
+        correct = sum(1 for q, a in zip(questions, user_answers) if a == q["correct_answer"])
+        score = int(correct / size * 100)
+        
+        timings = []
+        pdf_data = b""
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            pdf_data = generator.create_detailed_report("benchmark.pdf", questions, user_answers, score, feedback)
+            timings.append((time.perf_counter() - start) * 1000)
+        
+        print(f"{size:>9}  {statistics.median(timings):>10.1f}  {min(timings):>8.1f}  {max(timings):>8.1f}  "
+              f"{len(pdf_data or b'') / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
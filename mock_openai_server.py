@@ -0,0 +1,331 @@
+"""Local stand-in for the OpenAI chat completions endpoint, for load tests and benchmarks.
+
+    python mock_openai_server.py --port 9000 --latency lognormal:0.8,0.5 --rate-limit-rate 0.05
+    OPENAI_BASE_URL="http://127.0.0.1:9000/v1" OPENAI_API_KEY="mock" streamlit run app.py
+
+POST /v1/chat/completions answers the app's prompts: a {"questions": [...]}
+object for batch prompts, a single question object for MCQ prompts, and prose
+for feedback, streamed as server-sent events when the request asks for it.
+Questions are built from the passages in the prompt, so they differ like real
+ones do. Each request first waits a latency drawn from the configured
+distribution, then may fail with a 429 (with Retry-After) or a 500, or return
+malformed output, at the configured rates. With --tokens-per-second the body
+takes as long as a model generating that fast would. GET /stats returns
+request counts by kind and outcome.
+"""
+import re
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+FEEDBACK_WORDS = (
+    "review the key definitions in each section and connect them to the examples; "
+    "practice recalling the main arguments before checking the answers; "
+    "focus on the questions you missed and explain to yourself why the correct option is right; "
+    "steady effort like this builds real understanding, so keep going"
+).split()
+
+QUESTION_STEMS = [
+    "Which statement best reflects the passage's point about",
+    "According to the text, what is true of",
+    "What does the passage suggest regarding",
+    "Which conclusion is supported by the discussion of",
+]
+
+
+class LatencyDistribution:
+    """Samples a latency in seconds from a spec such as "lognormal:0.8,0.5".
+
+    Supported: fixed:SECONDS, uniform:LOW,HIGH, normal:MEAN,STDDEV (clamped at
+    zero) and lognormal:MEDIAN,SIGMA.
+    """
+    
+    ARITY = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+    
+    def __init__(self, spec):
+        name, _, args = spec.partition(":")
+        try:
+            self.params = [float(value) for value in args.split(",")] if args else []
+        except ValueError:
+            raise ValueError(f"invalid latency spec {spec!r}")
+        if self.ARITY.get(name) != len(self.params):
+            raise ValueError(f"latency spec must be one of fixed:S, uniform:LO,HI, normal:MU,SD, "
+                             f"lognormal:MEDIAN,SIGMA; got {spec!r}")
+        self.name = name
+        self.spec = spec
+    
+    def sample(self, rng):
+        if self.name == "fixed":
+            return self.params[0]
+        if self.name == "uniform":
+            return rng.uniform(*self.params)
+        if self.name == "normal":
+            return max(0.0, rng.gauss(*self.params))
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+class MockBehaviour:
+    """How the mock server responds: latency, failure rates and generation speed."""
+    
+    def __init__(self, latency="fixed:0", error_rate=0.0, rate_limit_rate=0.0, malformed_rate=0.0,
+                 tokens_per_second=0.0, retry_after=0.5, seed=None):
+        self.latency = latency if isinstance(latency, LatencyDistribution) else LatencyDistribution(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.tokens_per_second = tokens_per_second
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+    
+    def draw(self):
+        """Return (latency seconds, outcome, rng) for one request; outcome is ok, rate_limited or error."""
+        with self._lock:
+            latency = self.latency.sample(self._rng)
+            roll = self._rng.random()
+            malformed = self._rng.random() < self.malformed_rate
+            rng = random.Random(self._rng.getrandbits(64))
+        if roll < self.rate_limit_rate:
+            return latency, "rate_limited", rng
+        if roll < self.rate_limit_rate + self.error_rate:
+            return latency, "error", rng
+        return latency, "malformed" if malformed else "ok", rng
+
+
+def count_tokens(text):
+    """Rough token count (four characters per token), matching the app's fallback."""
+    return max(1, len(text) // 4)
+
+
+def make_question(rng, passage, number=None):
+    """A plausible question dict in the app's JSON format, built from passage."""
+    words = re.findall(r"[A-Za-z][A-Za-z'-]+", passage) or ["the", "main", "idea"]
+    start = rng.randrange(max(1, len(words) - 6))
+    subject = " ".join(words[start:start + 6])
+    options = []
+    for i in range(4):
+        option = " ".join(rng.choice(words) for _ in range(rng.randint(4, 8))).capitalize()
+        options.append(option if option not in options else f"{option} ({i + 1})")
+    question = {
+        "question": f"{rng.choice(QUESTION_STEMS)} {subject}?",
+        "options": options,
+        "correct": rng.choice("abcd"),
+        "explanation": f"The passage discusses {subject} directly, which supports this option.",
+    }
+    return {"passage": number, **question} if number is not None else question
+
+
+def make_feedback(rng, prompt):
+    words = [rng.choice(FEEDBACK_WORDS) for _ in range(rng.randint(90, 150))]
+    text = " ".join(words).capitalize() + "."
+    if "Analysis:" in prompt:
+        third = len(text) // 3
+        return f"Analysis: {text[:third]}\nRecommendations: {text[third:2 * third]}\nMessage: {text[2 * third:]}"
+    return text
+
+
+def respond_to(prompt, rng, malformed):
+    """Return (kind, content) answering one of the app's prompts."""
+    batch = re.search(r"Below are (\d+) numbered paragraphs", prompt)
+    if batch:
+        passages = re.findall(r'^\s*(\d+)\. "(.*)"\s*$', prompt, re.MULTILINE)
+        questions = [make_question(rng, text, int(number)) for number, text in passages[:int(batch.group(1))]]
+        kind, content = "mcq_batch", json.dumps({"questions": questions})
+    elif "multiple-choice question" in prompt:
+        passage = re.search(r'^\s*"(.*)"\s*$', prompt, re.MULTILINE)
+        kind, content = "mcq", json.dumps(make_question(rng, passage.group(1) if passage else prompt))
+    else:
+        return "feedback", make_feedback(rng, prompt)
+    
+    if malformed:
+        # Truncated JSON, a missing field, or prose instead of JSON
+        content = rng.choice([
+            content[:len(content) // 2],
+            content.replace('"correct"', '"answer_key"'),
+            "I'm sorry, here is a question about the text: what is its main idea?",
+        ])
+    return kind, content
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+    
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self.send_json(200, self.server.stats())
+        elif self.path.rstrip("/") == "/v1/models":
+            self.send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        else:
+            self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+    
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError:
+            self.send_json(400, {"error": {"message": "invalid JSON body", "type": "invalid_request_error"}})
+            return
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        
+        behaviour = self.server.behaviour
+        latency, outcome, rng = behaviour.draw()
+        prompt = "\n".join(str(message.get("content", "")) for message in request.get("messages", []))
+        kind, content = respond_to(prompt, rng, outcome == "malformed")
+        if kind == "feedback" and outcome == "malformed":
+            outcome = "ok"
+        self.server.record(kind, outcome)
+        time.sleep(latency)
+        
+        if outcome == "rate_limited":
+            self.send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error",
+                                           "code": "rate_limit_exceeded"}},
+                           {"retry-after-ms": str(int(behaviour.retry_after * 1000)),
+                            "retry-after": str(math.ceil(behaviour.retry_after))})
+            return
+        if outcome == "error":
+            self.send_json(500, {"error": {"message": "The server had an error (mock)", "type": "server_error"}})
+            return
+        
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "mock")}
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(content)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        seconds_per_token = 1.0 / behaviour.tokens_per_second if behaviour.tokens_per_second > 0 else 0.0
+        
+        if not request.get("stream"):
+            time.sleep(usage["completion_tokens"] * seconds_per_token)
+            self.send_json(200, {
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            })
+            return
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = re.findall(r"\S+\s*", content) or [content]
+        delay = usage["completion_tokens"] * seconds_per_token / len(pieces)
+        for i, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if i == 0 else {"content": piece}
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            time.sleep(delay)
+        final = {**base, "object": "chat.completion.chunk",
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.send_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            usage_chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+            self.send_chunk(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+        self.send_chunk(b"data: [DONE]\n\n")
+        self.send_chunk(b"")
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """Threaded mock endpoint; counts requests by kind and outcome."""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, behaviour=None):
+        super().__init__(address, MockOpenAIHandler)
+        self.behaviour = behaviour or MockBehaviour()
+        self.counts = Counter()
+        self._lock = threading.Lock()
+    
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+    
+    def record(self, kind, outcome):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts[f"kind:{kind}"] += 1
+            self.counts[f"outcome:{outcome}"] += 1
+    
+    def stats(self):
+        with self._lock:
+            return dict(self.counts)
+    
+    def start(self):
+        """Serve from a daemon thread and return self, for in-process use."""
+        threading.Thread(target=self.serve_forever, name="mock-openai", daemon=True).start()
+        return self
+
+
+def add_behaviour_arguments(parser):
+    parser.add_argument("--latency", default="lognormal:0.8,0.5",
+                        help="time before the first byte: fixed:S, uniform:LO,HI, normal:MU,SD or "
+                             "lognormal:MEDIAN,SIGMA (default lognormal:0.8,0.5)")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0,
+                        help="simulated generation speed after the first byte; 0 sends the body at once")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0,
+                        help="fraction of requests answered with a 429")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="fraction of question responses that are truncated or malformed")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Retry-After sent with 429s, in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def behaviour_from_args(args):
+    return MockBehaviour(args.latency, args.error_rate, args.rate_limit_rate, args.malformed_rate,
+                         args.tokens_per_second, args.retry_after, args.seed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI chat completions endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    add_behaviour_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    try:
+        behaviour = behaviour_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    server = MockOpenAIServer((args.host, args.port), behaviour)
+    print(f"Mock OpenAI endpoint at {server.base_url} (latency {args.latency})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
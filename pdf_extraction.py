@@ -0,0 +1,80 @@
+import io
+import os
+import time
+import hashlib
+import logging
+import multiprocessing
+import PyPDF2
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger("PDF Quiz Generator Application Using AI")
+
+# Documents with at least this many pages are split across a process pool
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("PDF_PARALLEL_PAGE_THRESHOLD", "40"))
+
+# Number of pages handed to a worker process at a time
+PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "16"))
+
+# Start extraction workers fresh rather than forking: the Streamlit server and
+# the app's client, scheduler and report pools run threads that fork would copy
+# mid-operation, locks included
+PROCESS_CONTEXT = multiprocessing.get_context("spawn")
+
+# Reader opened once per worker process by the pool initializer
+_worker_reader = None
+
+
+def _init_worker(pdf_bytes):
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+
+
+def _extract_page_range(start, stop):
+    """Extract the text of pages [start, stop) using the worker's reader."""
+    return [_worker_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_page_texts(pdf_bytes, max_workers=None):
+    """Yield (page_number, page_count, text) for every page, in page order.
+
+    Small documents are read serially in this process. Larger ones are fanned out
+    across a process pool in PAGES_PER_TASK chunks; pages are still yielded in
+    order, each chunk as soon as it and every chunk before it have finished.
+    """
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    max_workers = max_workers or os.cpu_count() or 1
+    
+    if page_count < PARALLEL_PAGE_THRESHOLD or max_workers < 2:
+        for i, page in enumerate(reader.pages):
+            yield i + 1, page_count, page.extract_text() or ""
+        return
+    
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    workers = min(max_workers, len(ranges))
+    logger.info(f"Extracting {page_count} pages across {workers} processes")
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=PROCESS_CONTEXT,
+                             initializer=_init_worker, initargs=(pdf_bytes,)) as executor:
+        futures = [executor.submit(_extract_page_range, start, stop) for start, stop in ranges]
+        for (start, _), future in zip(ranges, futures):
+            for offset, text in enumerate(future.result()):
+                yield start + offset + 1, page_count, text
+
+
+def clean_text(text):
+    """Flatten extracted page text into the single-line form the app works with."""
+    return text.replace('\n', ' ').replace('  ', ' ')
+
+
+def extract_file(path):
+    """Return (sha256 hex digest, cleaned text, seconds taken) for the PDF at path.
+
+    Pages are read serially: this is the unit of work for a process pool that
+    extracts many documents side by side, such as the batch CLI's.
+    """
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        pdf_bytes = f.read()
+    text = "".join(page_text for _, _, page_text in iter_page_texts(pdf_bytes, max_workers=1))
+    return hashlib.sha256(pdf_bytes).hexdigest(), clean_text(text), time.perf_counter() - started
@@ -0,0 +1,33 @@
+"""Tests for recording and replaying API exchanges."""
+import os
+import sys
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import CassetteTransport
+
+
+def echo(request):
+    return httpx.Response(200, json={"echo": request.content.decode("utf-8")})
+
+
+def post(transport, body):
+    with httpx.Client(transport=transport) as client:
+        return client.post("https://api.example.com/v1/chat/completions", content=body).json()
+
+
+def test_clients_share_one_recording(tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    first = CassetteTransport(httpx.MockTransport(echo), path, "record")
+    second = CassetteTransport(httpx.MockTransport(echo), path, "record")
+    post(first, '{"n": 1}')
+    post(second, '{"n": 2}')
+    
+    with open(path, encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    replay = CassetteTransport(httpx.MockTransport(echo), path, "replay", latency="zero")
+    assert post(replay, '{"n": 1}') == {"echo": '{"n": 1}'}
+    assert post(replay, '{"n": 2}') == {"echo": '{"n": 2}'}
+    assert replay.stats()["misses"] == 0
@@ -0,0 +1,44 @@
+"""Tests for near-duplicate question filtering."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import DuplicateQuestionFilter
+
+
+def make_mcq(question, correct_option):
+    return {"question": question, "correct_option": correct_option}
+
+
+def test_rejects_reworded_duplicate():
+    duplicate_filter = DuplicateQuestionFilter(0.6, seed=0)
+    assert duplicate_filter.add(make_mcq("What is the main function of mitochondria in the cell?", "Energy production"))
+    assert not duplicate_filter.add(make_mcq("What is the main function of the mitochondria in a cell?",
+                                             "Energy production"))
+    assert duplicate_filter.rejected == 1
+
+
+def test_keeps_distinct_questions_with_shared_phrasing():
+    duplicate_filter = DuplicateQuestionFilter(0.6, seed=0)
+    questions = [
+        ("What is the main function of mitochondria in the cell?", "To produce ATP through cellular respiration"),
+        ("What is the main function of ribosomes in the cell?", "To synthesize proteins"),
+        ("What is the main function of the nucleus in the cell?", "To store genetic information"),
+        ("Which gas do plants absorb during photosynthesis?", "Carbon dioxide"),
+    ]
+    assert all(duplicate_filter.add(make_mcq(*question)) for question in questions)
+
+
+def test_signatures_are_reproducible_with_a_seed():
+    mcq = make_mcq("Which gas do plants absorb during photosynthesis?", "Carbon dioxide")
+    first, second = DuplicateQuestionFilter(seed=1), DuplicateQuestionFilter(seed=1)
+    assert first._signature(first._shingle(mcq)) == second._signature(second._shingle(mcq))
+
+
+def test_only_band_candidates_are_compared():
+    duplicate_filter = DuplicateQuestionFilter(0.6, seed=0)
+    for i in range(200):
+        assert duplicate_filter.add(make_mcq(f"Topic {i}: {' '.join(str(i * j) for j in range(1, 12))}?", str(i)))
+    # Unrelated questions rarely share a band, so almost every bucket holds one question
+    assert len(duplicate_filter._buckets) > 0.9 * 200 * DuplicateQuestionFilter.BANDS
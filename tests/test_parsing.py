@@ -0,0 +1,136 @@
+"""Tests for parsing model responses into question dicts."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import AimockMCQGenerator, build_mcq, parse_mcq_response, parse_mcq_text
+
+OPTIONS = ["Apple", "A cell wall", "C", "D-glucose"]
+
+
+def build(correct, options=OPTIONS):
+    return build_mcq("Which one?", list(options), correct, "Because.", "A passage.", "Medium")
+
+
+def test_parse_mcq_text_canonical_format():
+    fields = parse_mcq_text(
+        "Question: What powers the cell?\n"
+        "a. Ribosomes\nb. Mitochondria\nc. Golgi body\nd. Lysosomes\n"
+        "Correct: b\nExplanation: Mitochondria produce ATP."
+    )
+    assert fields["question"] == "What powers the cell?"
+    assert fields["options"] == ["Ribosomes", "Mitochondria", "Golgi body", "Lysosomes"]
+    assert fields["correct"] == "b"
+    assert fields["explanation"] == "Mitochondria produce ATP."
+
+
+def test_parse_mcq_text_tolerates_format_drift():
+    fields = parse_mcq_text(
+        "**Question:** What powers\nthe cell?\n\n"
+        "A) Ribosomes\n(B) Mitochondria\nc: Golgi body\nD. Lysosomes\n"
+        "**Correct answer:** B.\nExplanation: They produce ATP\nfor the cell."
+    )
+    assert fields["question"] == "What powers the cell?"
+    assert fields["options"] == ["Ribosomes", "Mitochondria", "Golgi body", "Lysosomes"]
+    assert build_mcq(fields["question"], fields["options"], fields["correct"], fields["explanation"],
+                     "", "Easy")["correct_answer"] == "b"
+    assert fields["explanation"] == "They produce ATP for the cell."
+
+
+def test_parse_mcq_text_missing_options():
+    fields = parse_mcq_text("Question: What powers the cell?\na. Ribosomes\nCorrect: a")
+    assert fields["options"] == ["Ribosomes"]
+    with pytest.raises(ValueError):
+        build_mcq(fields["question"], fields["options"], fields["correct"], "", "", "Easy")
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps({"question": "Q?", "options": ["w", "x", "y", "z"], "correct": "c", "explanation": "e"}),
+    "```json\n" + json.dumps({"question": "Q?", "options": ["w", "x", "y", "z"], "correct": "c"}) + "\n```",
+    "Here is your question:\n" + json.dumps({"question": "Q?", "options": ["w", "x", "y", "z"], "correct": "c"}),
+])
+def test_parse_mcq_response_json(text):
+    fields, mode = parse_mcq_response(text)
+    assert mode == "json"
+    assert fields["question"] == "Q?"
+    assert fields["correct"] == "c"
+
+
+def test_parse_mcq_response_falls_back_to_text():
+    fields, mode = parse_mcq_response("Question: Q?\na. w\nb. x\nc. y\nd. z\nCorrect: d")
+    assert mode == "text_fallback"
+    assert fields["options"] == ["w", "x", "y", "z"]
+    assert fields["correct"] == "d"
+
+
+@pytest.mark.parametrize("correct, expected", [
+    ("b", "b"),
+    ("B", "b"),
+    ("b.", "b"),
+    ("(c)", "c"),
+    ("d)", "d"),
+    ("Option B", "b"),
+    ("answer is (c)", "c"),
+    ("A cell wall", "b"),
+    ("a cell wall", "b"),
+    ("D-glucose", "d"),
+    ("Apple", "a"),
+    ("b) A cell wall", "b"),
+])
+def test_build_mcq_correct_answer(correct, expected):
+    mcq = build(correct)
+    assert mcq["correct_answer"] == expected
+    assert mcq["correct_option"] == OPTIONS["abcd".index(expected)]
+
+
+@pytest.mark.parametrize("options, correct, expected", [
+    (["K", "D", "A", "C"], "a", "a"),
+    (["K", "D", "A", "C"], "C", "c"),
+    (["O", "A", "B", "AB"], "b", "b"),
+    (["O", "A", "B", "AB"], "(a)", "a"),
+    (["O", "A", "B", "AB"], "AB", "d"),
+])
+def test_build_mcq_prefers_labels_over_single_letter_options(options, correct, expected):
+    assert build(correct, options)["correct_answer"] == expected
+
+
+def test_build_mcq_strips_option_prefixes():
+    mcq = build("a", ["a. Apple", "B) Pear", "(c) Plum", "d. Fig"])
+    assert mcq["options"] == ["Apple", "Pear", "Plum", "Fig"]
+
+
+@pytest.mark.parametrize("correct", ["", "e", "Something else entirely", "A cell"])
+def test_build_mcq_rejects_unknown_answers(correct):
+    with pytest.raises(ValueError):
+        build(correct)
+
+
+def test_build_mcq_requires_four_options():
+    with pytest.raises(ValueError):
+        build("a", ["Apple", "Pear", "Plum"])
+    with pytest.raises(ValueError):
+        build("a", ["Apple", "Pear", "Plum", " "])
+
+
+def batch_item(passage):
+    return {"passage": passage, "question": "Q?", "options": ["w", "x", "y", "z"], "correct": "a", "explanation": ""}
+
+
+def test_batch_item_uses_its_numbered_passage():
+    mcq = AimockMCQGenerator._mcq_from_batch_item(batch_item("2"), ["first", "second"], "Medium")
+    assert mcq["paragraph"] == "second"
+
+
+@pytest.mark.parametrize("passage", [0, -1, 3, "two", None])
+def test_batch_item_rejects_unknown_passages(passage):
+    assert AimockMCQGenerator._mcq_from_batch_item(batch_item(passage), ["first", "second"], "Medium") is None
+
+
+def test_batch_item_requires_every_field():
+    item = batch_item(1)
+    del item["explanation"]
+    assert AimockMCQGenerator._mcq_from_batch_item(item, ["first"], "Medium") is None
@@ -0,0 +1,40 @@
+"""Tests for the SQLite question bank."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import QuestionBank
+
+
+def make_mcq(question):
+    return {"question": question, "options": ["w", "x", "y", "z"], "correct_answer": "a", "correct_option": "w",
+            "explanation": "", "paragraph": "A passage.", "difficulty": "Medium"}
+
+
+def test_fetch_matches_document_difficulty_and_topic(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    bank.add("doc", "Cells", [make_mcq("Q1?"), make_mcq("Q2?")])
+    assert {mcq["question"] for mcq in bank.fetch("doc", "Medium", " cells ", 10)} == {"Q1?", "Q2?"}
+    assert bank.fetch("doc", "Hard", "cells", 10) == []
+    assert bank.fetch("other", "Medium", "cells", 10) == []
+    assert len(bank.fetch("doc", "Medium", "cells", 1)) == 1
+
+
+def test_fetch_skips_excluded_questions(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    bank.add("doc", None, [make_mcq(f"Q{i}?") for i in range(5)])
+    served = {mcq["question"] for mcq in bank.fetch("doc", "Medium", None, 3)}
+    assert len(served) == 3
+    rest = bank.fetch("doc", "Medium", None, 5, exclude=served)
+    assert {mcq["question"] for mcq in rest} == {f"Q{i}?" for i in range(5)} - served
+    assert bank.fetch("doc", "Medium", None, 5, exclude={f"Q{i}?" for i in range(5)}) == []
+
+
+def test_fetch_handles_more_exclusions_than_sqlite_variables(tmp_path):
+    bank = QuestionBank(str(tmp_path / "bank.sqlite3"))
+    bank.add("doc", None, [make_mcq("Q1?"), make_mcq("Q2?")])
+    served = {f"Old question {i}?" for i in range(40000)} | {"Q1?"}
+    assert [mcq["question"] for mcq in bank.fetch("doc", "Medium", None, 5, exclude=served)] == ["Q2?"]
+    # Exclusions do not leak into the next fetch
+    assert len(bank.fetch("doc", "Medium", None, 5)) == 2
@@ -0,0 +1,31 @@
+"""Tests for the shared OpenAI request scheduler."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import RequestScheduler
+
+
+def test_plain_calls_release_their_slot():
+    scheduler = RequestScheduler(max_concurrency=2)
+    assert scheduler.call(lambda: "ok") == "ok"
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_stream_holds_its_slot_until_exhausted():
+    scheduler = RequestScheduler(max_concurrency=2)
+    stream = scheduler.call(lambda: iter(["a", "b"]), stream=True)
+    assert scheduler.stats()["in_flight"] == 1
+    assert list(stream) == ["a", "b"]
+    assert scheduler.stats()["in_flight"] == 0
+
+
+def test_stream_releases_its_slot_once_when_closed_early():
+    scheduler = RequestScheduler(max_concurrency=2)
+    with scheduler.call(lambda: iter(["a", "b"]), stream=True) as stream:
+        chunks = iter(stream)
+        assert next(chunks) == "a"
+        assert scheduler.stats()["in_flight"] == 1
+    stream.close()
+    assert scheduler.stats()["in_flight"] == 0